@@ -0,0 +1,52 @@
+"""
+ Build or query an inverted index of the abstracts of a csv file generated by
+ alldbpediapoints.py --abstracts
+ Vagueplaces Generator
+
+ The index can then be queried offline with vagueplaces.py --source index
+"""
+
+
+import argparse
+import time
+
+from cAbstractIndex import cAbstractIndex
+
+
+# ###########################
+#
+#  ARGUMENT PARSING
+#
+# ###########################
+
+parser = argparse.ArgumentParser(description='Build or query an inverted index of the place abstracts')
+
+parser.add_argument('--pointFile', default=None, dest='points',
+                    help='input file generated by alldbpediapoints.py --abstracts. Builds the index')
+parser.add_argument('--index', default='dbpedia.idx', dest='index',
+                    help='Index file [default dbpedia.idx]')
+parser.add_argument('--query', default=None, dest='query', nargs='+',
+                    help='Keywords to look for. Prints the matching places as id;name;country;x;y')
+
+args = parser.parse_args()
+
+# ###########################
+#
+#  START
+#
+# ###########################
+if args.points:
+    total = cAbstractIndex.build(args.points, args.index)
+    print "%s places indexed into %s" % (total, args.index)
+
+if args.query:
+    index = cAbstractIndex(args.index)
+    start = time.time()
+    ids = index.query(args.query)
+    elapsed = time.time() - start
+
+    print "id;name;country;x;y"
+    for pid in ids:
+        print "%s;%s" % (pid, ";".join(index.place(pid)))
+    print "%s places in %.1f ms" % (len(ids), elapsed * 1000)
+    index.close()
@@ -1,5 +1,8 @@
-from SPARQLWrapper import SPARQLWrapper, SPARQLExceptions, JSON
+from SPARQLWrapper import SPARQLWrapper, SPARQLExceptions, JSON, CSV
+from multiprocessing.pool import ThreadPool
+import Queue
 import argparse
+import csv
 import sys
 import threading
 import time
@@ -7,6 +10,11 @@ import signal
 import warnings
 import xml
 import codecs
+import os
+
+import sparql_functions as SPARQLF
+from cJournal import cJournal
+from cStage import cStage
 
 ############################
 #
@@ -24,6 +32,24 @@ parser.add_argument('--live', action='store_true',default=False,
                     dest='live_bool',
                     help='Use Dbpedia live SPARQL endpoint instead of last released version')
 
+parser.add_argument('--pagination', choices=SPARQLF.PAGINATION_MODES, default='keyset',
+                    dest='pagination',
+                    help='keyset resumes each page after the last seen ?place, keeping the page cost flat. offset uses OFFSET/LIMIT. tiles queries latitude/longitude boxes, split while they hit the page size, and also dumps places without country [default keyset]')
+
+parser.add_argument('--workers', type=int, default=4, dest='workers',
+                    help='Tiles queried in parallel with --pagination tiles [default 4]')
+
+parser.add_argument('--abstracts', action='store_true', default=False,
+                    dest='abstracts',
+                    help='Add the english abstract of each place as a last column. Needed to query the dump offline with vagueplaces.py --source csv')
+
+parser.add_argument('--resume', action='store_true', default=False,
+                    dest='resume',
+                    help='Continue an interrupted dump from its last committed page, appending to --output')
+
+parser.add_argument('--retries', type=int, default=8, dest='retries',
+                    help='Consecutive failed queries before giving up [default 8]')
+
 arguments  = parser.parse_args()
 
 
@@ -80,16 +106,43 @@ class cSpinner(threading.Thread):
 #  INITIALIZATIONS
 #
 ############################
-OF = codecs.open(arguments.fileout, 'wb', 'utf-8')
+JOURNAL = cJournal(arguments.fileout + ".journal")
+isresume = arguments.resume and JOURNAL.exists()
+#without its journal a partial dump cannot be resumed, do not truncate it
+if arguments.resume and not isresume and os.path.exists(arguments.fileout) and os.path.getsize(arguments.fileout) > 0:
+    parser.error("--resume: no journal %s for %s. Run without --resume to start the dump again"
+                 % (JOURNAL.filename, arguments.fileout))
 islive = arguments.live_bool
+pagination = arguments.pagination
+isabstracts = arguments.abstracts
 RESULTS_QUERY = 10000
+MIN_RESULTS_QUERY = 100 #page size never shrinks below this on timeouts
+GROW_AFTER = 5 #successful pages before the page size grows back
+QUEUE_PAGES = 2 #pages waiting between two stages
+MIN_TILE = 0.001 #degrees. Smaller tiles are paged instead of split
+
+
+if isresume:
+    JOURNAL.load()
+    #the output must keep being paged the same way it was started
+    pagination = JOURNAL.get("pagination")
+    isabstracts = JOURNAL.get("abstracts", False)
+    OF = codecs.open(arguments.fileout, 'r+b', 'utf-8')
+    OF.seek(JOURNAL.get("bytes"))
+    OF.truncate()
+else:
+    OF = codecs.open(arguments.fileout, 'wb', 'utf-8')
+
+iskeyset = pagination == 'keyset'
+istiles = pagination == 'tiles'
 
 if islive:
     sparql = SPARQLWrapper("http://live.dbpedia.org/sparql")
 else:
     sparql = SPARQLWrapper("http://dbpedia.org/sparql")
 
-sparql.setReturnFormat(JSON)
+sparql.setReturnFormat(CSV)
+csv.field_size_limit(sys.maxsize)
 
 #Spinner
 S = cSpinner()
@@ -104,17 +157,268 @@ def finish_program():
     OF.close()
     sys.exit(0)
 
-def wait_to_continue():
+def wait_to_continue(seconds):
     S.pause()
 
     waiter = cSpinner()
     waiter.set_char_array(["Waiting.","Waiting..","Waiting..."])
     waiter.start()
-    time.sleep(300)
+    time.sleep(seconds)
     waiter.stop()
 
     S.resume()
 
+def abstract_field(result):
+    """
+        Last column of a dump row: the quoted abstract on a single line, or nothing
+        when abstracts are not dumped
+    """
+    if not isabstracts:
+        return ""
+    return '"' + " ".join(result["abstract"].split()).replace('"', '""') + '"'
+
+def fetch_pages():
+    """
+        Fetch stage: run the page queries and read the raw responses.
+        \details As soon as a page is read and its next page located, the next query
+        is sent, while the previous pages are still being parsed and written.
+        Failed queries are retried with backoff, and smaller pages on timeouts.
+        \return Generator of page dictionaries
+    """
+    offset = start_offset
+    last_seen = start_last_seen
+    page_size = start_page_size
+    attempt = 0
+    successes = 0
+
+    while True:
+        try:
+            sparql.setQuery(SPARQLF.dump_query(islive, page_size, offset, last_seen, iskeyset, isabstracts))
+            body = sparql.query().response.read()
+        except Exception as inst:
+            #If exception happens, I assume is a network problem exception.
+            #Back off and retry, with smaller pages if the endpoint timed out
+            attempt += 1
+            if attempt > arguments.retries:
+                raise
+
+            successes = 0
+            if SPARQLF.is_timeout(inst):
+                page_size = max(MIN_RESULTS_QUERY, page_size // 2)
+
+            sys.stdout.write("\r\x1b[K"+str(inst)+"\n")
+            wait_to_continue(SPARQLF.backoff_delay(attempt))
+            continue
+
+        attempt = 0
+        header, rows = SPARQLF.read_page(body)
+        received, keep, cursor = SPARQLF.page_cursor(header, rows, page_size, iskeyset)
+        offset = offset + received
+        if iskeyset and cursor is not None:
+            last_seen = cursor
+
+        yield {"header": header,
+               "records": rows,
+               "keep": keep,
+               "rows": received,
+               "bytes": len(body),
+               "offset": offset,
+               "last_seen": last_seen,
+               "page_size": page_size,
+               "complete": received == 0}
+
+        if received == 0:
+            return
+
+        successes += 1
+        if successes >= GROW_AFTER and page_size < RESULTS_QUERY:
+            page_size = min(RESULTS_QUERY, page_size * 2)
+            successes = 0
+
+def format_rows(header, rows, keep):
+    """
+        Output lines of the first keep rows of a page, see SPARQLF.read_page()
+        \return unicode text
+    """
+    lines = []
+    variables = ["title", "country", "wikiurl", "geolat", "geolong"] + (["abstract"] if isabstracts else [])
+    columns = [(var, header.index(var)) for var in variables if header is not None and var in header]
+    for row in rows[:keep]:
+        #missing values, as csv.DictReader gave them
+        result = dict((var, (row[i] if i < len(row) else "").decode("utf-8")) for var, i in columns)
+        lines.append(result["title"] + ";" +
+                result["country"] + ";" +
+                result["wikiurl"] + ";" +
+                result["geolat"] + ";" +
+                result["geolong"] + ";" +
+                "POINT(" + result["geolong"] +" "+ result["geolat"] +");" +
+                abstract_field(result) + "\n"
+                )
+
+    return u"".join(lines)
+
+def parse_page(page):
+    """
+        Parse stage: decode the rows of a raw page into the output text
+    """
+    page["text"] = format_rows(page.pop("header"), page.pop("records"), page["keep"])
+    page["rows"] = page["keep"]
+    return page
+
+def write_page(page):
+    """
+        Write stage: append a page to the output and commit it in the journal
+    """
+    global total_results
+
+    OF.write(page.pop("text"))
+    total_results += page["rows"]
+
+    #commit the page: data on disk first, then the journal pointing after it
+    OF.flush()
+    os.fsync(OF.fileno())
+    committed = OF.tell()
+    JOURNAL.commit(pagination = pagination,
+                   abstracts = isabstracts,
+                   bytes = committed,
+                   rows = total_results,
+                   offset = page["offset"],
+                   last_seen = page["last_seen"],
+                   page_size = page["page_size"],
+                   complete = page["complete"])
+
+    page["total"] = total_results
+    return page
+
+def fetch_tile(tile):
+    """
+        Fetch every place of a tile, unless it has too many for one page.
+        \details Runs in the worker threads, each call with its own SPARQLWrapper.
+        Tiles smaller than MIN_TILE are not split anymore (many places on the same
+        coordinates) and are paged with keyset pagination instead.
+        \param tile (south, west, north, east)
+        \return Tuple (tile, result). result is the list of the four sub tiles when
+        the tile is full, a tuple (text, rows) with its output lines, or the exception
+        raised by the query
+    """
+    splittable = SPARQLF.tile_size(tile) > MIN_TILE
+
+    try:
+        client = SPARQLWrapper(sparql.endpoint)
+        client.setReturnFormat(CSV)
+        text = []
+        rows = 0
+        last_seen = None
+        while True:
+            client.setQuery(SPARQLF.dump_query(islive, RESULTS_QUERY, 0, last_seen, not splittable, isabstracts, tile))
+            header, page = SPARQLF.read_page(client.query().response.read())
+            received, keep, last_seen = SPARQLF.page_cursor(header, page, RESULTS_QUERY, not splittable)
+
+            if received >= RESULTS_QUERY and splittable:
+                return tile, SPARQLF.split_tile(tile)
+
+            text.append(format_rows(header, page, keep))
+            rows += keep
+            if received < RESULTS_QUERY:
+                return tile, (u"".join(text), rows)
+    except Exception as inst:
+        return tile, inst
+
+def dump_tiles(tiles):
+    """
+        Dump the places tile by tile, several tiles at a time.
+        \details Full tiles are replaced by their quadrants until every tile fits in
+        a page, so no query needs OFFSET. A failed tile is retried on its own after a
+        backoff while the others keep going, or split if the endpoint timed out.
+        The journal keeps the tiles not written yet.
+        \param tiles Tiles to dump
+    """
+    global total_results
+
+    pending = list(tiles)
+    attempts = {}
+    done = Queue.Queue()
+    pool = ThreadPool(arguments.workers)
+
+    def submit(tile):
+        pool.apply_async(fetch_tile, (tile,), callback=done.put)
+
+    def commit():
+        OF.flush()
+        os.fsync(OF.fileno())
+        JOURNAL.commit(pagination = 'tiles',
+                       abstracts = isabstracts,
+                       bytes = OF.tell(),
+                       rows = total_results,
+                       tiles = pending,
+                       complete = not pending)
+
+    for tile in pending:
+        submit(tile)
+    running = len(pending)
+
+    while running > 0:
+        #get() with a timeout keeps the main thread responsive to SIGINT.
+        tile, result = done.get(True, 0xFFFF)
+        running -= 1
+
+        if isinstance(result, Exception):
+            attempts[tile] = attempts.get(tile, 0) + 1
+            if attempts[tile] > arguments.retries:
+                raise result
+
+            sys.stdout.write("\r\x1b[K"+str(result)+"\n")
+            if SPARQLF.is_timeout(result) and SPARQLF.tile_size(tile) > MIN_TILE:
+                result = SPARQLF.split_tile(tile)
+            else:
+                TILES["retried"] += 1
+                timer = threading.Timer(SPARQLF.backoff_delay(attempts[tile]), submit, (tile,))
+                timer.daemon = True
+                timer.start()
+                running += 1
+                continue
+
+        pending.remove(tile)
+        if isinstance(result, list):
+            TILES["split"] += 1
+            pending.extend(result)
+            for child in result:
+                submit(child)
+            running += len(result)
+        else:
+            TILES["fetched"] += 1
+            text, rows = result
+            OF.write(text)
+            total_results += rows
+            S.set_count(total_results) #set spinner count
+        commit()
+
+    pool.close()
+
+def dump_pages():
+    """
+        Dump the places page by page in a fetch -> parse -> write pipeline, each stage
+        in its own thread linked by bounded queues
+    """
+    fetched = Queue.Queue(QUEUE_PAGES)
+    parsed = Queue.Queue(QUEUE_PAGES)
+    written = Queue.Queue()
+    STAGES.extend([cStage("fetch", fetch_pages, None, fetched),
+                   cStage("parse", parse_page, fetched, parsed),
+                   cStage("write", write_page, parsed, written)])
+
+    for stage in STAGES:
+        stage.start()
+
+    while True:
+        #get() with a timeout keeps the main thread responsive to SIGINT.
+        page = written.get(True, 0xFFFF)
+        if page is None:
+            break
+        if isinstance(page, Exception):
+            raise page
+        S.set_count(page["total"]) #set spinner count
+
 def get_total_dbpedia_points(islive):
     """ Count the total number of dbpedia points """
 
@@ -159,69 +463,51 @@ signal.signal(signal.SIGINT, kill_handler)
 #
 ############################
 
+if isresume and JOURNAL.get("complete"):
+    print "Dump already complete"
+    finish_program()
+
 print "Counting total entries"
 S.set_total(get_total_dbpedia_points(islive));
 S.start()
 
-header = "name;country;URL;x;y;WKT\n"
-OF.write(header)
+if isresume:
+    total_results = JOURNAL.get("rows")
+    start_offset = JOURNAL.get("offset")
+    start_last_seen = JOURNAL.get("last_seen")
+    start_page_size = JOURNAL.get("page_size")
+    start_tiles = [tuple(tile) for tile in JOURNAL.get("tiles", [])]
+else:
+    header = "name;country;URL;x;y;WKT\n"
+    if isabstracts:
+        header = "name;country;URL;x;y;WKT;abstract\n"
+    OF.write(header)
+    OF.flush()
 
-total_results = 0
-query_results = 1
-offset = 0
+    total_results = 0
+    start_offset = 0
+    start_last_seen = None
+    start_page_size = RESULTS_QUERY
+    start_tiles = [SPARQLF.WORLD_TILE]
+
+STAGES = []
+TILES = {"fetched": 0, "split": 0, "retried": 0}
 
 try:
-    while query_results > 0:
-        if islive:
-        	sparql.setQuery("""
-        	    SELECT ?title,?geolat,?geolong, ?country, ?wikiurl
-        	    WHERE{
-        	      ?place rdf:type dbo:Place .
-        	      ?place foaf:name ?title .
-        	      ?place geo:lat ?geolat .
-        	      ?place geo:long ?geolong .
-                      ?place dbo:wikiPageRevisionLink ?wikiurl .
-        	      ?place dbo:country ?country .
-        	    }
-        	    OFFSET """ + str(offset) + """
-        	    LIMIT """ + str(RESULTS_QUERY)+ """
-        	    """)
-        
-        else:
-        	sparql.setQuery("""
-        	    SELECT ?title,?geolat,?geolong, ?country, ?wikiurl
-        	    WHERE{
-        	      ?place rdf:type dbo:Place .
-        	      ?place foaf:name ?title .
-        	      ?place geo:lat ?geolat .
-        	      ?place geo:long ?geolong .
-        	      ?place prov:wasDerivedFrom ?wikiurl .
-        	      ?place dbo:country ?country .
-        	    }
-        	    OFFSET """ + str(offset) + """
-        	    LIMIT """ + str(RESULTS_QUERY)+ """
-        	    """)
-        
-        results_array = sparql.query().convert()
-        for result in results_array["results"]["bindings"]:
-            OF.write(result["title"]["value"] + ";" +
-                    result["country"]["value"] + ";" +
-                    result["wikiurl"]["value"] + ";" +
-                    result["geolat"]["value"] + ";" +
-                    result["geolong"]["value"] + ";" +
-                    "POINT(" + result["geolong"]["value"] +" "+ result["geolat"]["value"] +");" + "\n"
-                    )
-    
-        query_results = len(results_array["results"]["bindings"])
-        offset = offset + query_results
-        total_results += query_results
-        S.set_count(total_results) #set spinner count
-    
-        #except Exception as inst:
-        #    #If exception happens, I assume is a network problem exception. Wait 5 minutes and retry
-        #    sys.stdout.write("\r\x1b[K"+str(inst))
-        #    wait_to_continue()
+    if istiles:
+        dump_tiles(start_tiles)
+    else:
+        dump_pages()
+
+except Exception as inst:
+    sys.stdout.write("\r\x1b[K"+str(inst)+"\n")
+    print "Dump interrupted. Run again with --resume to continue from the last committed page"
 finally:
+    sys.stdout.write("\r\x1b[K")
+    for stage in STAGES:
+        print stage.stats()
+    if istiles:
+        print "%s tiles fetched, %s split, %s retried" % (TILES["fetched"], TILES["split"], TILES["retried"])
 
     ############################
     #
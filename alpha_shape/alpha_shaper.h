@@ -0,0 +1,578 @@
+/***********************************************************************
+
+Everything of alpha_shaper that depends on the geometry kernel.
+
+No includes and no include guard: main.cpp includes this file once per kernel,
+inside a namespace that defines K.
+
+************************************************************************/
+
+typedef K::FT FT;
+
+typedef K::Point_2  Point;
+typedef K::Segment_2  Segment;
+typedef CGAL::Polygon_2<K> Polygon_2;
+
+typedef CGAL::Alpha_shape_vertex_base_2<K> Vb;
+typedef CGAL::Alpha_shape_face_base_2<K>  Fb;
+typedef CGAL::Triangulation_data_structure_2<Vb,Fb> Tds;
+typedef CGAL::Delaunay_triangulation_2<K,Tds> Triangulation_2;
+
+typedef CGAL::Alpha_shape_2<Triangulation_2>  Alpha_shape_2;
+
+typedef Alpha_shape_2::Face  Face;
+typedef Alpha_shape_2::Vertex Vertex;
+typedef Alpha_shape_2::Edge Edge;
+typedef Alpha_shape_2::Face_handle  Face_handle;
+typedef Alpha_shape_2::Vertex_handle Vertex_handle;
+
+typedef Alpha_shape_2::Face_circulator  Face_circulator;
+typedef Alpha_shape_2::Vertex_circulator  Vertex_circulator;
+
+typedef Alpha_shape_2::Locate_type Locate_type;
+
+typedef Alpha_shape_2::Face_iterator  Face_iterator;
+typedef Alpha_shape_2::Vertex_iterator  Vertex_iterator;
+typedef Alpha_shape_2::Edge_iterator  Edge_iterator;
+typedef Alpha_shape_2::Edge_circulator  Edge_circulator;
+
+typedef Alpha_shape_2::Alpha_iterator Alpha_iterator;
+typedef Alpha_shape_2::Alpha_shape_edges_iterator Alpha_shape_edges_iterator;
+typedef Alpha_shape_2::Alpha_shape_vertices_iterator Alpha_shape_vertices_iterator;
+
+/**
+ \brief Edge of the alpha shape boundary, oriented with the interior on its left
+*/
+struct Boundary_edge {
+  Vertex_handle source;
+  Vertex_handle target;
+};
+
+typedef boost::unordered_map<Vertex_handle, std::vector<std::size_t>, CGAL::Handle_hash_function> Outgoing_map;
+typedef boost::unordered_map<Vertex_handle, std::size_t, CGAL::Handle_hash_function> Position_map;
+
+typedef CGAL::Box_intersection_d::Box_with_handle_d<double, 2, const Polygon_2*> Polygon_box;
+
+//---------------------------------------------------------------------
+
+template <class OutputIterator>
+void
+alpha_edges( const Alpha_shape_2&  A,
+	     OutputIterator out)
+{
+
+  for(Alpha_shape_edges_iterator it =  A.alpha_shape_edges_begin();
+      it != A.alpha_shape_edges_end();
+      ++it){
+      *out++ = A.segment(*it);
+  }
+}
+
+/**
+ \brief Regular edges of the alpha shape, oriented with the interior face on their left
+ \details Outer rings are then counterclockwise and holes clockwise. Singular edges
+ do not bound any interior face and are left out.
+*/
+template <class OutputIterator>
+void
+boundary_edges( const Alpha_shape_2&  A,
+	     OutputIterator out)
+{
+
+  for(Alpha_shape_edges_iterator it =  A.alpha_shape_edges_begin();
+      it != A.alpha_shape_edges_end();
+      ++it){
+      if (A.classify(*it) != Alpha_shape_2::REGULAR) continue;
+
+      Face_handle f = it->first;
+      int i = it->second;
+      if (A.classify(f) != Alpha_shape_2::INTERIOR){
+        Face_handle n = f->neighbor(i);
+        i = n->index(f);
+        f = n;
+      }
+
+      Boundary_edge b;
+      b.source = f->vertex(f->ccw(i));
+      b.target = f->vertex(f->cw(i));
+      *out++ = b;
+  }
+}
+
+template <class OutputIterator>
+void
+alpha_vertices( const Alpha_shape_2&  A,
+	     OutputIterator out)
+{
+
+  for(Alpha_shape_vertices_iterator it =  A.alpha_shape_vertices_begin();
+      it != A.alpha_shape_vertices_end();
+      ++it){
+      *out++ = Vertex_handle(*it);
+  }
+}
+
+template <class OutputIterator>
+bool
+file_input(OutputIterator out,char* filename)
+{
+  std::ifstream is(filename, std::ios::in);
+
+  if(is.fail()){
+    std::cerr << "unable to open file for input" << std::endl;
+    return false;
+  }
+
+  int n;
+  is >> n;
+  CGAL::copy_n(std::istream_iterator<Point>(is), n, out);
+
+  return true;
+}
+
+//------------------ functions --------------------------------------
+
+
+bool check_inside(const Point& pt, const Polygon_2& pgn, K traits)
+{
+  //std::cout << "The point " << pt;
+  switch(CGAL::bounded_side_2(pgn.vertices_begin(), pgn.vertices_end(), pt, traits)) {
+    case CGAL::ON_BOUNDED_SIDE :
+      //std::cout << " is inside the polygon.\n";
+      return true;
+    case CGAL::ON_BOUNDARY:
+      //std::cout << " is on the polygon boundary.\n";
+      return false;
+    case CGAL::ON_UNBOUNDED_SIDE:
+      //std::cout << " is outside the polygon.\n";
+      return false;
+  }
+}
+
+/**
+* Checks if plg2 is inside plg1
+*/
+bool is_inside(const Polygon_2& plg1, const Polygon_2& plg2){
+  bool ishole = true;
+  for (Polygon_2::Vertex_const_iterator v2 = plg2.vertices_begin();
+      v2 != plg2.vertices_end();
+      ++v2){
+      if(! check_inside(*v2, plg1, K())){
+        ishole = false;
+        break; //stop checking
+      }
+  }
+  return ishole;
+}
+
+/**
+\brief Prints a polygon in its WKT form (p1,p2,p3,....)
+
+\note Does not add POLYGON text. It is used inside other printing functions
+*/
+void print_WKT_polygon_2(Polygon_2 plg){
+ 
+  
+  std::cout << "(";
+  std::vector<Point>::iterator v;
+  for ( v = plg.vertices_begin();
+      v != plg.vertices_end()-1;
+      ++v){
+      std::cout << *v << ",";
+  }
+  v = plg.vertices_end()-1; //last one with no comma
+  std::cout << *v << ")";
+
+}
+
+/**
+ \brief Clockwise angle from the direction vertex->previous to the direction vertex->next
+ \details In (0, 2pi]. Going straight back to previous is 2pi
+*/
+double clockwise_turn(const Point& previous, const Point& vertex, const Point& next){
+  double vx = CGAL::to_double(vertex.x());
+  double vy = CGAL::to_double(vertex.y());
+  double back = std::atan2(CGAL::to_double(previous.y()) - vy, CGAL::to_double(previous.x()) - vx);
+  double out = std::atan2(CGAL::to_double(next.y()) - vy, CGAL::to_double(next.x()) - vx);
+
+  double angle = std::fmod(back - out, 2 * CGAL_PI);
+  if (angle <= 0) angle += 2 * CGAL_PI;
+  return angle;
+}
+
+/**
+ \brief Cuts a closed ring of vertices at its repeated vertices into simple rings
+ \details A ring going twice through a vertex is a hole touching its outer ring, or
+ two parts of the shape touching at that vertex.
+ \param ring Vertices of the ring, the first one not repeated at the end
+ \param &rings INOUT Simple rings
+*/
+void split_ring(const std::vector<Vertex_handle>& ring, std::vector< std::vector<Vertex_handle> > &rings){
+  Position_map position;
+  std::vector<Vertex_handle> stack;
+
+  for(std::size_t k = 0; k <= ring.size(); ++k){
+    Vertex_handle v = ring[k % ring.size()];
+    Position_map::iterator found = position.find(v);
+    if (found != position.end()){
+      std::size_t i = found->second;
+      rings.push_back(std::vector<Vertex_handle>(stack.begin() + i, stack.end()));
+      for(std::size_t j = i; j < stack.size(); ++j){
+        position.erase(stack[j]);
+      }
+      stack.resize(i);
+    }
+    position[v] = stack.size();
+    stack.push_back(v);
+  }
+}
+
+/**
+ \brief Generates a vector of polygons from the boundary edges of the alpha shape
+ \details Edges are chained through a hash map from each vertex to the edges leaving
+ it, so every edge is visited once: linear time, and no limit on the number of rings.
+ Where several rings touch at a vertex (pinch), the edge leaving it closest clockwise
+ to the incoming one is taken, so the ring follows the same interior corner. Rings
+ going twice through a vertex are then cut there into simple rings.
+ \param edges Boundary edges from boundary_edges()
+ \param &polygons INOUT A std::vector<Polygon_2> with CGAL Polygon_2, first vertex repeated at the end
+*/
+void edges_to_polygons(const std::vector<Boundary_edge>& edges, std::vector< Polygon_2 > &polygons){
+
+  Outgoing_map outgoing;
+  for(std::size_t i = 0; i < edges.size(); ++i){
+    outgoing[edges[i].source].push_back(i);
+  }
+
+  std::vector<bool> used(edges.size(), false);
+  std::vector< std::vector<Vertex_handle> > rings;
+
+  for(std::size_t first = 0; first < edges.size(); ++first){
+    if (used[first]) continue;
+
+    std::vector<Vertex_handle> ring;
+    std::size_t current = first;
+    bool more = true;
+    while (more && !used[current]){
+      used[current] = true;
+      ring.push_back(edges[current].source);
+
+      Vertex_handle v = edges[current].target;
+      const std::vector<std::size_t>& candidates = outgoing[v];
+      more = false;
+      double best = 0;
+      std::size_t next = current;
+      for(std::size_t c = 0; c < candidates.size(); ++c){
+        if (used[candidates[c]] && candidates[c] != first) continue;
+        double angle = candidates.size() == 1 ? 0 :
+                       clockwise_turn(edges[current].source->point(), v->point(), edges[candidates[c]].target->point());
+        if (!more || angle < best){
+          best = angle;
+          next = candidates[c];
+          more = true;
+        }
+      }
+      current = next;
+    }
+
+    split_ring(ring, rings);
+  }
+
+  for(std::size_t i = 0; i < rings.size(); ++i){
+    Polygon_2 P;
+    for(std::size_t j = 0; j < rings[i].size(); ++j){
+      P.push_back(rings[i][j]->point());
+    }
+    P.push_back(P[0]);
+    if (P.size() > 3){
+        polygons.push_back(P);
+    }
+  }
+}
+
+
+//------------------ printing functions -----------------------------
+
+/**
+ \brief Callback of box_self_intersection_d: runs the polygon test on a candidate pair
+ \details A polygon can only be inside another one if its bounding box is inside the
+ other bounding box, so the full test is only run on those pairs.
+*/
+struct Containment_callback {
+  const std::vector<Polygon_2>* polygons;
+  std::vector< std::vector<std::size_t> >* containers;
+
+  void test(std::size_t outer, std::size_t inner){
+    const Polygon_2& plg1 = (*polygons)[outer];
+    const Polygon_2& plg2 = (*polygons)[inner];
+    if (bbox_inside(plg1.bbox(), plg2.bbox()) && is_inside(plg1, plg2)){
+      (*containers)[inner].push_back(outer);
+    }
+  }
+
+  void operator()(const Polygon_box& a, const Polygon_box& b){
+    std::size_t i = a.handle() - &(*polygons)[0];
+    std::size_t j = b.handle() - &(*polygons)[0];
+    test(i, j);
+    test(j, i);
+  }
+};
+
+/**
+ \brief Finds which polygons are inside which
+ \details Candidate pairs come from the intersections of the polygon bounding boxes
+ (CGAL box_self_intersection_d), so the point in polygon tests are not run on every
+ pair. The result is the same as testing every pair.
+ \param &containers INOUT containers[i]: polygons with polygon i inside
+ \param &holes INOUT holes[i]: polygons inside polygon i, in index order
+*/
+void nest_polygons(const std::vector<Polygon_2>& polygons,
+                   std::vector< std::vector<std::size_t> > &containers,
+                   std::vector< std::vector<std::size_t> > &holes){
+  containers.assign(polygons.size(), std::vector<std::size_t>());
+  holes.assign(polygons.size(), std::vector<std::size_t>());
+  if (polygons.empty()) return;
+
+  std::vector<Polygon_box> boxes;
+  for(std::size_t i = 0; i < polygons.size(); ++i){
+    boxes.push_back(Polygon_box(polygons[i].bbox(), &polygons[i]));
+  }
+
+  Containment_callback callback;
+  callback.polygons = &polygons;
+  callback.containers = &containers;
+  CGAL::box_self_intersection_d(boxes.begin(), boxes.end(), callback);
+
+  for(std::size_t i = 0; i < polygons.size(); ++i){
+    for(std::size_t c = 0; c < containers[i].size(); ++c){
+      holes[containers[i][c]].push_back(i);
+    }
+  }
+}
+
+/**
+* Prints a WKT version of the polygons to stdout
+*
+* NOTE: if a polygon is inside another polygon is treated as a hole
+*
+* A polygon inside no other one is printed with every polygon inside it as holes,
+* in index order. See nest_polygons()
+*/
+void toWKT_polygons(const std::vector<Polygon_2>& polygons){
+  std::vector< std::vector<std::size_t> > containers;
+  std::vector< std::vector<std::size_t> > holes;
+  nest_polygons(polygons, containers, holes);
+
+  for(std::size_t i = 0; i < polygons.size(); ++i){
+     //print the first polygon part
+     if (!containers[i].empty()){
+       continue;
+     }
+     std::cout << "POLYGON(";
+     print_WKT_polygon_2(polygons[i]);
+
+    //print the holes with the polygon
+    for(std::size_t h = 0; h < holes[i].size(); ++h){
+      std::cout << ",";
+      print_WKT_polygon_2(polygons[holes[i][h]]);
+    }
+    std::cout << ")" << std::endl;
+  }
+
+}
+
+/**
+* Prints a csv list of the Alpha shape segments
+*/
+void toWKT_segments(std::vector<Segment> segments){
+
+  std::cout << "id;wkt" << std::endl;
+  int count = 0;
+
+  for(std::vector<Segment>::iterator it = segments.begin(); it != segments.end();++it){
+    std::cout << count << ";" << "LINESTRING(" << it->source() << "," << it->target() << ") " << std::endl;
+    count++;
+  }
+  
+}
+
+void toWKT_vertices(std::vector<Vertex_handle> segments){
+  int count = 0; 
+  
+  std::cout << "id;wkt" << std::endl;
+  for(std::vector<Vertex_handle>::iterator it = segments.begin(); it != segments.end();++it){
+    Point p=(*it)->point();
+    std::cout << count << ";" << "POINT(" << p[0] << " " << p[1] << ")" << std::endl;
+    count++;
+  }
+}
+
+//------------------ binary protocol --------------------------------
+
+/**
+ \brief Appends a WKB linear ring: point count, then x y of every point
+ \param ring Polygon with the first vertex repeated at the end, as edges_to_polygons() builds them
+*/
+void put_WKB_ring(std::string &out, const Polygon_2& ring){
+  put<uint32_t>(out, ring.size());
+  for (Polygon_2::Vertex_const_iterator v = ring.vertices_begin(); v != ring.vertices_end(); ++v){
+    put<double>(out, CGAL::to_double(v->x()));
+    put<double>(out, CGAL::to_double(v->y()));
+  }
+}
+
+/**
+ \brief WKB MultiPolygon of the polygons, nested as toWKT_polygons() prints them
+*/
+std::string WKB_polygons(const std::vector<Polygon_2>& polygons){
+  std::vector< std::vector<std::size_t> > containers;
+  std::vector< std::vector<std::size_t> > holes;
+  nest_polygons(polygons, containers, holes);
+
+  std::string out;
+  put<uint8_t>(out, 1);
+  put<uint32_t>(out, 6);
+  std::size_t count = out.size();
+  put<uint32_t>(out, 0);
+
+  uint32_t shells = 0;
+  for(std::size_t i = 0; i < polygons.size(); ++i){
+    if (!containers[i].empty()) continue;
+    put<uint8_t>(out, 1);
+    put<uint32_t>(out, 3);
+    put<uint32_t>(out, 1 + holes[i].size());
+    put_WKB_ring(out, polygons[i]);
+    for(std::size_t h = 0; h < holes[i].size(); ++h){
+      put_WKB_ring(out, polygons[holes[i][h]]);
+    }
+    shells++;
+  }
+  std::memcpy(&out[count], &shells, sizeof(shells));
+  return out;
+}
+
+/**
+ \brief Polygons of the alpha shape at its current alpha
+ \param &polygons INOUT A std::vector<Polygon_2>, see edges_to_polygons()
+*/
+void alpha_polygons(const Alpha_shape_2& A, std::vector< Polygon_2 > &polygons){
+  std::vector<Boundary_edge> boundary;
+  boundary_edges( A, std::back_inserter(boundary));
+  edges_to_polygons(boundary, polygons);
+}
+
+/**
+ \brief Answers one job: the optimal alpha and the shape for every alpha of the job
+ \return Result payload
+*/
+std::string shape_job(const std::string& payload){
+  uint32_t npoints, nalphas;
+  if (payload.size() < 2 * sizeof(uint32_t)){
+    return std::string("\x01") + "truncated job";
+  }
+  std::memcpy(&npoints, &payload[0], sizeof(npoints));
+  std::memcpy(&nalphas, &payload[sizeof(npoints)], sizeof(nalphas));
+  if (payload.size() != 2 * sizeof(uint32_t) + (2 * (std::size_t)npoints + nalphas) * sizeof(double)){
+    return std::string("\x01") + "job size does not match its header";
+  }
+
+  std::vector<double> values(2 * (std::size_t)npoints + nalphas);
+  if (!values.empty()){
+    std::memcpy(&values[0], &payload[2 * sizeof(uint32_t)], values.size() * sizeof(double));
+  }
+
+  std::list<Point> points;
+  for(std::size_t i = 0; i < npoints; ++i){
+    points.push_back(Point(values[i], values[npoints + i]));
+  }
+
+  Alpha_shape_2 A(points.begin(), points.end());
+  A.set_mode(Alpha_shape_2::GENERAL);
+  Alpha_iterator opt = A.find_optimal_alpha(1);
+
+  std::string out;
+  put<uint8_t>(out, 0);
+  put<double>(out, opt == A.alpha_end() ? 0 : CGAL::to_double(*opt));
+  put<uint32_t>(out, nalphas);
+  for(std::size_t i = 0; i < nalphas; ++i){
+    A.set_alpha(values[2 * (std::size_t)npoints + i]);
+    std::vector< Polygon_2 > polygons;
+    alpha_polygons(A, polygons);
+
+    std::string shape = WKB_polygons(polygons);
+    put<uint32_t>(out, shape.size());
+    out += shape;
+  }
+  return out;
+}
+
+/**
+ \brief Answers jobs on stdin until it is closed
+ \details A failing job gets an error result and the next job is read
+*/
+int serve_binary(){
+  std::string payload;
+  while (read_message(payload)){
+    std::string result;
+    try {
+      result = shape_job(payload);
+    }
+    catch (std::exception& e){
+      result = std::string("\x01") + e.what();
+    }
+    write_message(result);
+  }
+  return 0;
+}
+
+/**
+ \brief Runs alpha_shaper on an input file, printing the result on stdout
+ \param filename Input file. First line with total number of coordinates
+ \param alpha Alpha value, -1 for the optimal alpha
+*/
+int run(char* filename, float alpha, bool optalpha, bool bpoints, bool bsegments){
+  //File Input
+  std::list<Point> points;
+
+  if(! file_input(std::back_inserter(points),filename)){
+    return -1;
+  }
+
+  //Alpha shape compute
+  Alpha_shape_2 A(points.begin(), points.end());
+  A.set_mode(Alpha_shape_2::GENERAL);
+  Alpha_iterator opt = A.find_optimal_alpha(1);
+  
+  if (alpha != -1){
+    A.set_alpha(alpha);
+  }
+  else{
+    A.set_alpha(*opt);
+  }
+  
+  
+  std::vector<Segment> segments;
+  std::vector<Vertex_handle> vertices;
+  std::vector< Polygon_2 > polygons;
+
+  alpha_edges( A, std::back_inserter(segments));
+  alpha_vertices( A, std::back_inserter(vertices));
+  alpha_polygons( A, polygons);
+
+  //Fill and print result
+  if (optalpha){
+      std::cout << *opt << std::endl;
+      return 0;
+  }
+  if (bpoints){
+    toWKT_vertices(vertices);
+  }
+  else if (bsegments){
+    toWKT_segments(segments);
+  }
+  else{
+   toWKT_polygons(polygons);
+  }
+  
+  return 0;
+}
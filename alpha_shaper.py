@@ -0,0 +1,122 @@
+"""
+ In process replacement of alpha_shape/alpha_shaper
+ Vagueplaces Generator
+
+ Reads the same input files (first line the number of points, then one "lon lat"
+ per line), or the places of a country of a point store (point_store.py), and
+ writes the alpha shape polygons as WKT, one POLYGON per line.
+ With --server it stays alive and answers binary jobs on stdin, see cShaperPool.py
+"""
+
+
+import argparse
+import sys
+
+import numpy
+
+import geom_functions as GEOM
+from cAlphaShape import cAlphaShape
+from cPointStore import cPointStore
+from cShaperPool import read_message, write_message, decode_job, encode_result, encode_error
+
+
+# ###########################
+#
+#  ARGUMENT PARSING
+#
+# ###########################
+
+parser = argparse.ArgumentParser(description='Generates an alpha shape WKT as multiple POLYGONS. Result on STDOUT')
+
+parser.add_argument('-i', default=None, dest='input',
+                    help='Input file with coordinates. First line with total number of coordinates')
+parser.add_argument('--pointStore', default=None, dest='store',
+                    help='Point store built with point_store.py, read instead of -i. Needs --country')
+parser.add_argument('--country', default=None, dest='country',
+                    help='Country URI of the points read from --pointStore')
+parser.add_argument('-a', type=float, default=None, dest='alphas', nargs='+',
+                    help='Alpha values. By default the optimal alpha. With several alphas each line is alpha;WKT')
+parser.add_argument('--optimalalpha', action='store_true', default=False, dest='optimal',
+                    help='Print the optimal alpha instead of the shape')
+parser.add_argument('--server', action='store_true', default=False, dest='server',
+                    help='Answer length prefixed binary jobs on stdin until it is closed')
+
+args = parser.parse_args()
+
+if not args.server and args.input is None and args.store is None:
+    parser.error("-i or --pointStore is needed unless --server is given")
+if args.store is not None and args.country is None:
+    parser.error("--pointStore needs --country")
+
+
+# ###########################
+#
+#  FUNCTIONS
+#
+# ###########################
+def read_points(filename):
+    """
+        Read an alpha_shaper input file
+        \return Tuple (lon list, lat list)
+    """
+    lon = []
+    lat = []
+    with open(filename) as fileh:
+        total = int(fileh.readline())
+        for line in fileh:
+            if len(lon) == total:
+                break
+            x, y = line.split()
+            lon.append(float(x))
+            lat.append(float(y))
+    return lon, lat
+
+def serve(instream, outstream):
+    """
+        Answer jobs until the input stream is closed. A failing job gets an error
+        result, the server keeps going
+    """
+    while True:
+        payload = read_message(instream)
+        if payload is None:
+            return
+
+        try:
+            lon, lat, alphas = decode_job(payload)
+            shaper = cAlphaShape(lon, lat)
+            result = encode_result(shaper.optimal_alpha(), [shape for alpha, shape in shaper.sweep(alphas)])
+        except Exception as inst:
+            result = encode_error(str(inst))
+        write_message(outstream, result)
+
+
+# ###########################
+#
+#  START
+#
+# ###########################
+if args.server:
+    serve(sys.stdin, sys.stdout)
+    sys.exit(0)
+
+if args.store is not None:
+    store = cPointStore(args.store)
+    first, last = store.country_range(args.country)
+    if first == last:
+        parser.error("%s is not a country of %s" % (args.country, args.store))
+    lon, lat = [numpy.array(values) for values in store.coordinates(args.country)]
+    store.close()
+else:
+    lon, lat = read_points(args.input)
+shaper = cAlphaShape(lon, lat)
+
+if args.optimal:
+    print shaper.optimal_alpha()
+elif args.alphas is None:
+    print GEOM.polygons_wkt(shaper.shape(shaper.optimal_alpha()))
+elif len(args.alphas) == 1:
+    print GEOM.polygons_wkt(shaper.shape(args.alphas[0]))
+else:
+    for alpha, shape in shaper.sweep(args.alphas):
+        for line in GEOM.polygons_wkt(shape).splitlines():
+            print "%s;%s" % (alpha, line)
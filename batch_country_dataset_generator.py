@@ -14,17 +14,27 @@
 
 import os
 import re
+import shutil
 import sys
 import csv
 import argparse
+import hashlib
+import multiprocessing
 import signal
 import tempfile
+import time
 import xml, warnings
 
+import numpy
+
 import cSpinner
 import cPlace
 import cReport
 import geom_functions as GEOM
+import shard_functions as SHARD
+from cHandlePool import cHandlePool
+from cJournal import cJournal
+from cPointStore import cPointStore
 
 
 # ###########################
@@ -38,8 +48,14 @@ parser = argparse.ArgumentParser(description='Filter an input dataset into small
 
 parser.add_argument('--outDir', default=None, dest='outDir',help='Directory where to store the country points outputs')
 parser.add_argument('--pointFile', default=None, dest='points',help='input file with points to split in smaller files')
+parser.add_argument('--pointStore', default=None, dest='store',help='Point store built with point_store.py, read instead of pointFile. Shapes are computed from the store')
 
 parser.add_argument('--nospinner', default=False, dest='nospinner',help='Deactivate live feedback via shell. For batch operations', action="store_true")
+parser.add_argument('--maxOpen', type=int, default=64, dest='maxOpen',help='Largest number of country files open at the same time, per worker [default 64]')
+parser.add_argument('--workers', type=int, default=None, dest='workers',help='Parsing processes [default: one per core]')
+parser.add_argument('--alphas', type=float, default=None, dest='alphas', nargs='+',help='Also compute the alpha shapes of every country for these alphas, in outDir/alphaShape_<country>_<alpha>.csv. Only the ones whose points or alphas changed since the last run are computed again')
+parser.add_argument('--engine', choices=['python', 'cgal'], default='python', dest='engine',help='Alpha shape implementation: in process or the alpha_shape/alpha_shaper binary [default python]')
+parser.add_argument('--skipSplit', default=False, dest='skipSplit',help='Use the country points files already in outDir instead of splitting pointFile', action="store_true")
 #parser.add_argument('--country', default=None, dest='countryFilter', help='Filter by country')
 
 
@@ -67,20 +83,188 @@ if not args.nospinner:
 
 csv.field_size_limit(sys.maxsize)
 
-def gen_alpha_shape(cgalfile, alpha):
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+def read_country_points(pointfile):
+    """
+        Reads the coordinates of a country points file
+        "name;country;wikipediaURL;x;y;WKT" with x the latitude and y the longitude
+        \return Tuple (lon list, lat list)
+    """
+    lon = []
+    lat = []
+    with open(pointfile, 'rb') as infile:
+        preader = csv.reader(infile, delimiter=';', quotechar='"')
+        next(preader)
+        for row in preader:
+            try:
+                lat.append(float(row[3]))
+                lon.append(float(row[4]))
+            except (IndexError, ValueError):
+                del lat[len(lon):]
+    return lon, lat
+
+def country_points(source):
+    """
+        Coordinates of a country
+        \param source Country points file, or tuple (point store file, country URI)
+        \return Tuple (lon, lat)
     """
-        External system execution of alpha_shaper to generate a WKT alpha shape file.
-        Expects a CGAL file with lon lat corrdinates and the first line an integer
-        of the total number of lines to read
+    if isinstance(source, tuple):
+        store = cPointStore(source[0])
+        lon, lat = [numpy.array(values) for values in store.coordinates(source[1])]
+        store.close()
+        return lon, lat
+    return read_country_points(source)
 
-        returns the well known text of this alpha shape polygons
+def shape_file(outdir, country, alpha):
+    return os.path.join(outdir, "alphaShape_%s_%s.csv" % (country, alpha))
+
+def points_hash(lon, lat):
+    """
+        \return Hex digest of the coordinates of a country, in file order
     """
-    opt_alpha, wkt_polygons = GEOM.alpha_shape(cgalfile,alpha);
-    return wkt_polygons.splitlines()
+    digest = hashlib.sha1(numpy.asarray(lon, dtype="<f8").tobytes())
+    digest.update(numpy.asarray(lat, dtype="<f8").tobytes())
+    return digest.hexdigest()
 
-def finish_program():
+def shape_country(job):
+    """
+        Computes the alpha shapes of a country points file for a list of alphas
+        \details All the alphas share one triangulation. Every shape is written to a
+        temporary file of outdir, renamed to alphaShape_<country>_<alpha>.csv once
+        complete, so an interrupted batch never leaves a partial output.
+        An alpha is only shaped again when its output is missing or the manifest entry
+        of the country was made from other points or with another engine. Countries
+        with fewer than 3 points are not shaped. Errors are returned, not raised, so a
+        failing country does not stop the batch.
+        \param job Tuple (country, source, alphas, outdir, engine, manifest entry or None),
+        source as in country_points()
+        \return Tuple (country, status, number of points, seconds, new manifest entry, detail)
+        status is "shaped" (detail: shaped alphas), "unchanged", "small" or "failed"
+        (detail: error message, entry None)
+    """
+    country, source, alphas, outdir, engine, entry = job
+    start = time.time()
+    try:
+        lon, lat = country_points(source)
+
+        digest = points_hash(lon, lat)
+        if entry and entry["hash"] == digest and entry["engine"] == engine:
+            done = [alpha for alpha in entry["alphas"] if os.path.exists(shape_file(outdir, country, alpha))]
+        else:
+            done = []
+        alphas = [alpha for alpha in alphas if alpha not in done]
+        entry = {"hash": digest, "engine": engine, "points": len(lon), "alphas": done}
+        if len(lon) < 3:
+            return country, "small", len(lon), time.time() - start, entry, []
+        if not alphas:
+            return country, "unchanged", len(lon), time.time() - start, entry, []
+
+        if engine == 'cgal':
+            opt_alpha, shapes = GEOM.alpha_shapes_cgal(lon, lat, alphas)
+        else:
+            opt_alpha, shapes = GEOM.alpha_shapes(lon, lat, alphas)
+
+        for alpha, shape in zip(alphas, shapes):
+            fileh = tempfile.NamedTemporaryFile(prefix='.alphaShape', dir=outdir, delete=False)
+            try:
+                write_file_wkt_csv(GEOM.polygons_wkt(shape).splitlines(), fileh)
+                fileh.close()
+                #temporary files are only readable by their owner
+                os.chmod(fileh.name, 0666 & ~UMASK)
+                os.rename(fileh.name, shape_file(outdir, country, alpha))
+            except:
+                fileh.close()
+                os.remove(fileh.name)
+                raise
+    except Exception as inst:
+        return country, "failed", 0, time.time() - start, None, "%s: %s" % (type(inst).__name__, inst)
+
+    entry["alphas"] = sorted(done + alphas)
+    return country, "shaped", len(lon), time.time() - start, entry, alphas
+
+def country_sources(outdir, storefile=None):
+    """
+        Countries to shape, with their size
+        \return list of (size, country, source), source as in country_points()
+    """
+    if storefile:
+        store = cPointStore(storefile)
+        try:
+            return [(int(size), slugify(uri), (storefile, uri))
+                    for uri, size in zip(store.countries(), store.counts())]
+        finally:
+            store.close()
+
+    sources = []
+    for name in os.listdir(outdir):
+        if name.endswith("_points.csv"):
+            pointfile = os.path.join(outdir, name)
+            sources.append((os.path.getsize(pointfile), name[:-len("_points.csv")], pointfile))
+    return sources
+
+def shape_countries(outdir, alphas, workers=None, engine='python', storefile=None):
+    """
+        Computes the alpha shapes of every country points file of outdir, or of every
+        country of a point store
+        \details outdir/manifest.json keeps, for every country, the hash of its points,
+        the engine and the alphas of its outputs. Only the countries whose points changed
+        since, or that miss some of the alphas, are shaped again, so refreshing a dump or
+        running an interrupted batch again only costs the countries that need it.
+        Countries are shaped in a pool of workers processes, the largest ones first so
+        the last jobs running are short ones. The manifest is committed after every
+        country, and when the batch is interrupted (the workers ignore SIGINT, the pool
+        is terminated by the parent).
+        \return dict status -> sorted list of countries, status as in shape_country().
+        Failed countries are listed as (country, error message)
+    """
+    manifest = cJournal(os.path.join(outdir, "manifest.json"))
+    if manifest.exists():
+        manifest.load()
+    #temporary shapes of workers terminated by an interrupted run
+    for name in os.listdir(outdir):
+        if name.startswith(".alphaShape"):
+            os.remove(os.path.join(outdir, name))
+
+    jobs = [(size, (country, source, alphas, outdir, engine, manifest.get(country)))
+            for size, country, source in country_sources(outdir, storefile)]
+    jobs = [job for size, job in sorted(jobs, reverse=True)]
+
+    results = dict((status, []) for status in ("shaped", "unchanged", "small", "failed"))
+    S.set_msg("Checking %s countries" % len(jobs))
+    pool = multiprocessing.Pool(workers or multiprocessing.cpu_count(), SHARD.ignore_interrupt)
+    try:
+        shaped = pool.imap_unordered(shape_country, jobs)
+        for done in range(len(jobs)):
+            #next() with a timeout keeps the main thread responsive to SIGINT
+            country, status, points, seconds, entry, detail = shaped.next(0xFFFF)
+            if status == "failed":
+                results[status].append((country, detail))
+                S.set_msg("Failed %s/%s: %s, %s" % (done + 1, len(jobs), country, detail))
+                continue
+            results[status].append(country)
+            manifest.state[country] = entry
+            if status == "shaped":
+                manifest.commit()
+                S.set_msg("Shaped %s/%s: %s, %s points in %.1f s" % (done + 1, len(jobs), country, points, seconds))
+    except:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+        manifest.commit()
+
+    for status in results:
+        results[status].sort()
+    return results
+
+def finish_program(status=0):
     S.stop()
-    sys.exit(0)
+    sys.exit(status)
 
 
 def write_file_wkt_csv(wkt_polygons, fileh):
@@ -105,68 +289,92 @@ def write_file_cgal(places, fileh):
         fileh.write(p.lon+" "+p.lat+"\n")
 
 
-def read_countries_from_csv(filename):
-    """
-        Reads a CSV points file
-        "name;WKT;Country;Abstract"
+def country_file(outdir, country):
+    return os.path.join(outdir, "%s_points.csv" % slugify(country))
 
-	We read this information apart because reading the whole
-	file can destroy our memory
+def split_shard(filename, start, end, header, tmpdir, max_open):
     """
-    data = []
+        Splits a shard of the points file (see @ref shard_functions) by country
+        \details Every valid row (a dbpedia resource as country) goes to
+        tmpdir/<start>/<country>_points.csv, with no header, through a @ref cHandlePool
+        that keeps at most max_open files open.
+        \return Tuple (start, countries found, lines read, failed lines)
+    """
+    columns = [header.index(c) for c in ("name", "country", "URL", "x", "y", "WKT")]
+    icountry = columns[1]
     total = 0
     failed = 0
 
-    totalL = sum(1 for line in open(filename))
-    with open(filename, 'rb') as csvfile:
-        preader = csv.DictReader(csvfile, delimiter=';', quotechar='"')
-        for row in preader:
-            S.set_msg("Reading Countries: %s/%s. FAILED: %s"%(total,totalL,failed))
+    partdir = os.path.join(tmpdir, str(start))
+    os.mkdir(partdir)
+    pool = cHandlePool(lambda country: country_file(partdir, country), "", max_open,
+                       delimiter=';', quotechar='"')
+    try:
+        for row in SHARD.shard_rows(filename, start, end):
             total+=1
-
-            if "http://dbpedia.org/resource/" not in row["country"]:
+            #dirty lines may be short
+            if len(row) < len(header) or "http://dbpedia.org/resource/" not in row[icountry]:
                 failed+=1
                 continue
+            pool.writerow(row[icountry], [row[i] for i in columns])
+    finally:
+        pool.close()
 
-            if row["country"] not in data:
-                #country = re.sub("http://dbpedia.org/resource/","", row["country"])
-                #country = re.sub("http://dbpedia.org/resource/","", country)
-                country = row["country"]
-                data.append(country)
+    return start, pool.keys(), total, failed
 
-    return data
-
-
-def extract_countries_to_files(filename, outdir, countryNames):
+def split_countries(filename, outdir, max_open=64, workers=None):
     """
-        retrieves all the points from a filename that match a countryName
-        and stores those points to another file
-        "name;WKT;Country;Abstract"
+        Splits a points file in one file per country
+        \details The file is cut in shards parsed by a pool of workers processes, each
+        one splitting its shard in a temporary directory of outdir. The parts of every
+        country are then put together, in file order, in outdir/<country>_points.csv.
+        "name;country;wikipediaURL;x;y;WKT"
+        \return list of countries found
     """
-    data = []
-    total = 0
-    fileHandles = {}
-
-    for countryName in countryNames:
-        fileout = os.path.join(args.outDir, "%s_points.csv" % slugify(countryName))
-        handle = open(fileout, 'wb')
-        handle.write("name;country;wikipediaURL;x;y;WKT\n")
-    	pwriter = csv.writer(handle, delimiter=';', quotechar='"')
-        fileHandles[countryName] = [handle, pwriter]
+    tmpdir = tempfile.mkdtemp(prefix='.split', dir=outdir)
+    try:
+        S.set_msg("Filtering & splitting")
+        shards = SHARD.map_shards(filename, split_shard, (SHARD.read_header(filename), tmpdir, max_open), workers)
+
+        countries = set()
+        for start, found, total, failed in shards:
+            countries.update(found)
+        S.set_msg("Merging %s countries. Lines: %s. FAILED: %s" % (len(countries),
+                  sum(shard[2] for shard in shards), sum(shard[3] for shard in shards)))
+
+        for country in countries:
+            with open(country_file(outdir, country), 'wb') as outfile:
+                outfile.write("name;country;wikipediaURL;x;y;WKT\n")
+                for start, found, total, failed in shards:
+                    if country in found:
+                        with open(country_file(os.path.join(tmpdir, str(start)), country), 'rb') as part:
+                            shutil.copyfileobj(part, outfile)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    return sorted(countries)
+
+def split_store(storefile, outdir):
+    """
+        Writes the country points files of a point store built with point_store.py
+        \details Same files as split_countries(), the coordinates are written back from
+        their float64 values (shortest repr) instead of the dump text.
+        \return list of countries found
+    """
+    S.set_msg("Splitting the point store")
+    store = cPointStore(storefile)
+    countries = store.countries()
+    for country in countries:
+        first, last = store.country_range(country)
+        with open(country_file(outdir, country), 'wb') as outfile:
+            outfile.write("name;country;wikipediaURL;x;y;WKT\n")
+            pwriter = csv.writer(outfile, delimiter=';', quotechar='"')
+            for pid in range(first, last):
+                name, country, url, lat, lon = store.place(pid)
+                pwriter.writerow([name, country, url, repr(lat), repr(lon), "POINT(%r %r)" % (lon, lat)])
+    store.close()
+    return countries
 
-    totalL = sum(1 for line in open(filename))
-    with open(filename, 'rb') as infile:
-    	preader = csv.DictReader(infile, delimiter=';', quotechar='"')
-    	for row in preader:
-    	    S.set_msg("Filtering & splitting %s"% total)
-    	    total+=1
-            if row["country"] in fileHandles.keys():
-                #os is the file. 1 is the csv parser
-    	        fileHandles[row["country"]][1].writerow([row["name"],row["country"],row["URL"],row["x"],row["y"],row["WKT"]])
-
-    for name, handle in fileHandles.items():
-        handle[0].close()
- 
 def extract_country_to_file(filename, fileout, countryName):
     """
         retrieves all the points from a filename that match a countryName
@@ -260,69 +468,30 @@ signal.signal(signal.SIGINT, kill_handler)
 # ###########################
 
 #Open Points file
+status = 0
 try:
 
     if not os.path.exists(args.outDir):
         os.mkdir(args.outDir)
 
-    S.set_msg("Parsing input")
-    #CREATE A NICE TEMPFILE for CGAL from the input data
-    tmpfile = tempfile.NamedTemporaryFile(prefix='vagueplace',delete=True);
-
-    #Can't use this since it's using a lot of memory. This approach was getting
-    #everything in RAM and then start processing. We have to do something slower
-    #but less memory hungry
-    #datain          = read_points_csv(args.points)
-
-
-    # First get the countries
-    S.set_msg("Generating country list")
-    countries  = read_countries_from_csv(args.points)
-    extract_countries_to_files(args.points, args.outDir, countries)
-    #for country in countries:
-    #    # For each country split the output in different files that we will
-    #    # read one by one to generate the output files
-    #    fileout = os.path.join(args.outDir, "%s_points.csv" % slugify(country))
-    #    extract_countries_to_files(args.points, fileout, country)
-    #    print
-    sys.exit(1)
-    #places, errors  = parse_input_to_place(datain)
-
-    #first the whole dataset
-    #write_file_cgal(places, tmpfile)
-
-    #if not os.path.exists(args.outDir):
-    #    os.mkdir(args.outDir)
-
-    #for alphaVal in args.alphas:
-    #    S.set_msg("Shaping %s" % alphaVal)
-    #    fileName = os.path.join(args.outDir, "alphaShape_%s.csv" % alphaVal)
-    #    with open(fileName, 'wb') as fileh:
-    #        polygons = gen_alpha_shape(tmpfile, alphaVal)
-    #        write_file_wkt_csv(polygons, fileh)
-
-
-    #Now country by country
-    ###data = (p.country for p in places)
-    ###data = set(data)
-    ###for c in data:
-    ###    cdata = []
-    ###    country_points = (p for p in places if p.country == c)
-    ###    for cp in country_points:
-    ###        cdata.append(cp)
-
-    ###    tmpfile = tempfile.NamedTemporaryFile(prefix='countryData',delete=True);
-    ###    write_file_cgal(cdata, tmpfile)
-
-    ###    for alphaVal in args.alphas:
-    ###        S.set_msg("Shaping %s %s" % (c, alphaVal))
-    ###        fileName = os.path.join(args.outDir, "alphaShape_%s_%s.csv" % (c, alphaVal))
-    ###        with open(fileName, 'wb') as fileh:
-    ###            polygons = gen_alpha_shape(tmpfile, alphaVal)
-    ###            write_file_wkt_csv(polygons, fileh)
-
+    if args.store and not args.skipSplit:
+        countries = split_store(args.store, args.outDir)
+    elif not args.skipSplit:
+        S.set_msg("Splitting countries")
+        countries  = split_countries(args.points, args.outDir, args.maxOpen, args.workers)
+
+    if args.alphas:
+        results = shape_countries(args.outDir, args.alphas, args.workers, args.engine, args.store)
+        print "Shaped %s countries: %s" % (len(results["shaped"]), ", ".join(results["shaped"]))
+        print "Skipped %s unchanged countries: %s" % (len(results["unchanged"]), ", ".join(results["unchanged"]))
+        print "Skipped %s countries with fewer than 3 points: %s" % (len(results["small"]), ", ".join(results["small"]))
+        print "Failed %s countries: %s" % (len(results["failed"]),
+                                          ", ".join("%s (%s)" % failed for failed in results["failed"]))
+        if results["failed"]:
+            status = 1
 
 except Exception as e:
     print e
+    status = 1
 finally:
-    finish_program()
+    finish_program(status)
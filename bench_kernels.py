@@ -0,0 +1,145 @@
+"""
+ Geometry kernel benchmark: epick vs epec
+ Vagueplaces Generator
+
+ Runs the compiled alpha_shaper with both kernels (--kernel epick and --kernel epec)
+ on a point file of the repo and on synthetic clustered point sets, and prints for
+ each run the time, the peak memory of the alpha_shaper process and the differences
+ between the shapes of both kernels: optimal alpha, number of polygons and holes,
+ and the area of their symmetric difference. epec is the reference.
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import time
+
+import numpy
+
+import geom_functions as GEOM
+from cShaperPool import LENGTH, encode_job, read_message, decode_result
+
+
+# ###########################
+#
+#  ARGUMENT PARSING
+#
+# ###########################
+
+parser = argparse.ArgumentParser(description='Benchmark the epick and epec kernels of alpha_shaper')
+
+parser.add_argument('--pointFile', default=os.path.join(os.path.dirname(os.path.realpath(__file__)), "results", "twente.csv"),
+                    dest='points', help='CSV with a POINT(lon lat) per line [default results/twente.csv]')
+
+parser.add_argument('--sizes', type=int, default=[10000, 100000, 1000000], dest='sizes', nargs='*',
+                    help='Number of points of the synthetic sets [default 10000 100000 1000000]')
+
+parser.add_argument('--alpha', type=float, default=[0.001, 0.01, 0.1], dest='alphas', nargs='+',
+                    help='Alpha values shaped on every set [default 0.001 0.01 0.1]')
+
+parser.add_argument('--binary', default=GEOM.CGAL_SHAPER, dest='binary',
+                    help='alpha_shaper executable [default alpha_shape/alpha_shaper]')
+
+arguments = parser.parse_args()
+
+KERNELS = ["epec", "epick"]
+
+
+# ###########################
+#
+#  FUNCTIONS
+#
+# ###########################
+def read_points(filename):
+    """
+        Coordinates of every POINT(lon lat) in a file
+        \return Tuple (lon list, lat list)
+    """
+    lon = []
+    lat = []
+    point = re.compile(r"POINT\(\s*(\S+)\s+([^\s)]+)\s*\)")
+    with open(filename) as fileh:
+        for line in fileh:
+            match = point.search(line)
+            if match:
+                lon.append(float(match.group(1)))
+                lat.append(float(match.group(2)))
+    return lon, lat
+
+def synthetic_points(size,seed=0):
+    """
+        Clustered points in lat/lon degrees: towns around a few centres, like a country
+        \return Tuple (lon array, lat array)
+    """
+    rng = numpy.random.RandomState(seed)
+    centres = rng.uniform((-10, 35), (30, 60), size=(20, 2))
+    spread = rng.uniform(0.1, 2, size=20)
+    cluster = rng.randint(0, 20, size=size)
+    points = centres[cluster] + rng.normal(size=(size, 2)) * spread[cluster][:, None]
+    #coordinates as they come from DBpedia
+    points = numpy.round(points, 5)
+    return points[:, 0], points[:, 1]
+
+def run(kernel,lon,lat,alphas):
+    """
+        Shape a point set on a new alpha_shaper process
+        \return Tuple (seconds, peak memory in MB, optimal alpha, list of shapely MultiPolygon)
+    """
+    job = encode_job(lon, lat, alphas)
+
+    start = time.time()
+    process = subprocess.Popen([arguments.binary, "--binary", "--kernel", kernel],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    #the whole job is read before the answer is written
+    process.stdin.write(LENGTH.pack(len(job)) + job)
+    process.stdin.close()
+    payload = read_message(process.stdout)
+    process.stdout.close()
+    #ru_maxrss keeps the size of the forked python before exec, a floor of some MB
+    pid, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.time() - start
+
+    if status != 0 or payload is None:
+        raise RuntimeError("alpha_shaper --kernel %s failed" % kernel)
+    optimal, shapes = decode_result(payload)
+    return elapsed, usage.ru_maxrss / 1024.0, optimal, shapes
+
+def holes(shape):
+    return sum(len(polygon.interiors) for polygon in shape.geoms)
+
+def compare(name,lon,lat):
+    """
+        Run both kernels on a point set and print one line per kernel and alpha
+    """
+    results = dict((kernel, run(kernel, lon, lat, arguments.alphas)) for kernel in KERNELS)
+    reference = results["epec"]
+
+    for kernel in KERNELS:
+        elapsed, memory, optimal, shapes = results[kernel]
+        for alpha, shape, expected in zip(arguments.alphas, shapes, reference[3]):
+            difference = shape.symmetric_difference(expected).area
+            same = (optimal == reference[2] and len(shape.geoms) == len(expected.geoms)
+                    and holes(shape) == holes(expected) and difference == 0)
+            print (name.ljust(16) + str(len(lon)).rjust(9) + kernel.rjust(7) + ("%.2f" % elapsed).rjust(9) +
+                   ("%.1f" % memory).rjust(9) + str(alpha).rjust(8) + ("%g" % optimal).rjust(12) +
+                   str(len(shape.geoms)).rjust(9) + str(holes(shape)).rjust(7) +
+                   ("%g" % difference).rjust(12) + ("same" if same else "DIFFERENT").rjust(11))
+
+
+# ###########################
+#
+#  START
+#
+# ###########################
+print ("points".ljust(16) + "size".rjust(9) + "kernel".rjust(7) + "seconds".rjust(9) + "MB".rjust(9) +
+       "alpha".rjust(8) + "optimal".rjust(12) + "polygons".rjust(9) + "holes".rjust(7) +
+       "diff area".rjust(12) + "vs epec".rjust(11))
+
+lon, lat = read_points(arguments.points)
+if lon:
+    compare(os.path.basename(arguments.points), lon, lat)
+
+for size in arguments.sizes:
+    lon, lat = synthetic_points(size)
+    compare("synthetic", lon, lat)
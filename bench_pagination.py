@@ -0,0 +1,181 @@
+"""
+ Pagination benchmark: OFFSET vs keyset
+ Vagueplaces Generator
+
+ Pages through a synthetic dump served by a local stand-in SPARQL endpoint and
+ prints the latency of each page against its depth, for both pagination
+ strategies of alldbpediapoints.py.
+
+ The stand-in endpoint mimics how Virtuoso answers the dump query: OFFSET walks
+ over every skipped row before returning the page, keyset pagination seeks the
+ ?place index directly.
+"""
+
+from SPARQLWrapper import SPARQLWrapper
+import BaseHTTPServer
+import StringIO
+import argparse
+import bisect
+import csv
+import re
+import threading
+import time
+import urlparse
+
+import sparql_functions as SPARQLF
+
+
+# ###########################
+#
+#  ARGUMENT PARSING
+#
+# ###########################
+
+parser = argparse.ArgumentParser(description='Benchmark OFFSET against keyset pagination on a local stand-in endpoint')
+
+parser.add_argument('--rows', type=int, default=200000, dest='rows',
+                    help='Number of rows of the synthetic dump [default 200000]')
+
+parser.add_argument('--page', type=int, default=10000, dest='page',
+                    help='Page size (LIMIT) [default 10000]')
+
+parser.add_argument('--port', type=int, default=8890, dest='port',
+                    help='Port of the stand-in endpoint [default 8890]')
+
+arguments = parser.parse_args()
+
+
+# ###########################
+#
+#  STAND-IN ENDPOINT
+#
+# ###########################
+PLACES = ["http://dbpedia.org/resource/Place_%08d" % i for i in range(arguments.rows)]
+
+VARS = ["place", "title", "geolat", "geolong", "country", "wikiurl"]
+
+def place_row(place):
+    """
+        Result row of a synthetic place
+    """
+    i = int(place.rpartition('_')[-1])
+    return [place,
+            "Place %d" % i,
+            str(40 + (i % 2000) / 100.0),
+            str(-5 + (i % 3000) / 100.0),
+            "http://dbpedia.org/resource/Country_%d" % (i % 50),
+            "http://en.wikipedia.org/wiki/Place_%d" % i]
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+        Answers the dump queries built by sparql_functions.dump_query()
+    """
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        params = urlparse.parse_qs(urlparse.urlparse(self.path).query)
+        self.answer(params.get("query", [""])[0])
+
+    def do_POST(self):
+        length = int(self.headers.getheader('content-length', 0))
+        params = urlparse.parse_qs(self.rfile.read(length))
+        self.answer(params.get("query", [""])[0])
+
+    def answer(self, query):
+        limit = int(re.search(r"LIMIT\s+(\d+)", query).group(1))
+        offset = re.search(r"OFFSET\s+(\d+)", query)
+        last_seen = re.search(r'STR\(\?place\) > "([^"]*)"', query)
+
+        if offset:
+            #Virtuoso has to produce and discard every skipped row
+            start = 0
+            for skipped in xrange(int(offset.group(1))):
+                place_row(PLACES[skipped])
+                start += 1
+        elif last_seen:
+            start = bisect.bisect_right(PLACES, last_seen.group(1))
+        else:
+            start = 0
+
+        out = StringIO.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(VARS)
+        for p in PLACES[start:start + limit]:
+            writer.writerow(place_row(p))
+        body = out.getvalue()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# ###########################
+#
+#  FUNCTIONS
+#
+# ###########################
+def run(keyset):
+    """
+        Page through the whole stand-in dump
+        \param keyset True for keyset pagination, False for OFFSET
+        \return list of (depth, seconds) tuples, one per page
+    """
+    sparql = SPARQLWrapper("http://127.0.0.1:%d/sparql" % arguments.port)
+
+    timings = []
+    depth = 0
+    offset = 0
+    last_seen = None
+    query_results = 1
+
+    while query_results > 0:
+        page = {}
+        kept = 0
+
+        start = time.time()
+        rows = SPARQLF.stream_query(sparql, SPARQLF.dump_query(False, arguments.page, offset, last_seen, keyset))
+        if keyset:
+            rows = SPARQLF.keyset_rows(rows, arguments.page, page)
+        for row in rows:
+            kept += 1
+        elapsed = time.time() - start
+
+        if keyset:
+            query_results = page["rows"]
+            last_seen = page["last_seen"]
+        else:
+            query_results = kept
+
+        if query_results > 0:
+            timings.append((depth, elapsed))
+
+        offset += query_results
+        depth += kept
+
+    return timings
+
+
+# ###########################
+#
+#  START
+#
+# ###########################
+server = BaseHTTPServer.HTTPServer(("127.0.0.1", arguments.port), StandInHandler)
+thread = threading.Thread(target=server.serve_forever)
+thread.daemon = True
+thread.start()
+
+offset_timings = run(False)
+keyset_timings = run(True)
+server.shutdown()
+
+print "rows: %d page: %d" % (arguments.rows, arguments.page)
+print "depth".rjust(12) + "offset ms".rjust(12) + "keyset ms".rjust(12)
+for (depth, t_offset), (_, t_keyset) in zip(offset_timings, keyset_timings):
+    print str(depth).rjust(12) + ("%.1f" % (t_offset * 1000)).rjust(12) + ("%.1f" % (t_keyset * 1000)).rjust(12)
+
+print "total".rjust(12) + ("%.1f" % (sum(t for d, t in offset_timings) * 1000)).rjust(12) + \
+    ("%.1f" % (sum(t for d, t in keyset_timings) * 1000)).rjust(12)
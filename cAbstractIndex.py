@@ -0,0 +1,218 @@
+import array
+import csv
+import mmap
+import re
+import struct
+import sys
+
+class cAbstractIndex():
+    """
+        \brief Memory-mapped inverted index over the place abstracts of a dump
+        \details Answers the keyword disjunction of vagueplaces.py without scanning the
+        abstracts. DBpedia is queried with regex(?abstract, " keyword", "i"): a keyword
+        matches when it starts a word that is preceded by a space. The index keeps, for
+        every lowercased word that is not the first of an abstract, the sorted list of
+        places (posting list) containing it. A keyword is answered with the union of the
+        posting lists of all the words it is a prefix of.
+
+        File layout (little endian), sections in this order after the header:
+        - header: magic, then number of places, countries, words and postings (uint64)
+        - country table: offsets (uint64, countries+1) and utf-8 heap of URIs
+        - place country ids (uint32, places)
+        - place table: offsets (uint64, places+1) and utf-8 heap of "title\tlat\tlon"
+        - vocabulary: offsets (uint64, words+1) and utf-8 heap of sorted words
+        - postings: offsets (uint64, words+1) and place ids (uint32, postings)
+    """
+    MAGIC = "VPIDX001"
+    HEADER = struct.Struct("<8s4Q")
+
+    def __init__(self,filename):
+        """
+            Class constructor. Maps an index built with build()
+            \param filename Path of the index file
+        """
+        self.filename = filename
+        self.fileh = open(filename, "rb")
+        self.mm = mmap.mmap(self.fileh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.nplaces, self.ncountries, self.nwords, self.npostings = self.HEADER.unpack_from(self.mm, 0)
+        if magic != self.MAGIC:
+            raise ValueError("%s is not an abstract index" % filename)
+
+        pos = self.HEADER.size
+        self.__countries, pos = self.__table(pos, self.ncountries)
+        self.__country_ids = pos
+        pos += 4 * self.nplaces
+        self.__places, pos = self.__table(pos, self.nplaces)
+        self.__words, pos = self.__table(pos, self.nwords)
+        self.__posting_offsets = pos
+        self.__postings = pos + 8 * (self.nwords + 1)
+
+    def __table(self,pos,count):
+        """
+            Locate a (offsets, heap) section
+            \return ((offsets position, heap position), position after the section)
+        """
+        heap = pos + 8 * (count + 1)
+        size = struct.unpack_from("<Q", self.mm, pos + 8 * count)[0]
+        return (pos, heap), heap + size
+
+    def __string(self,table,i):
+        offsets, heap = table
+        start, end = struct.unpack_from("<2Q", self.mm, offsets + 8 * i)
+        return self.mm[heap + start:heap + end]
+
+    def close(self):
+        self.mm.close()
+        self.fileh.close()
+
+    def countries(self):
+        """
+            \brief Country URIs of the indexed places, sorted
+        """
+        return [self.__string(self.__countries, i) for i in range(self.ncountries)]
+
+    def place(self,i):
+        """
+            \brief Place of an id
+            \return Tuple (title, country_uri, lat, lon) of strings
+        """
+        title, lat, lon = self.__string(self.__places, i).split("\t")
+        country = struct.unpack_from("<I", self.mm, self.__country_ids + 4 * i)[0]
+        return title, self.__string(self.__countries, country), lat, lon
+
+    def __word(self,i):
+        return self.__string(self.__words, i)
+
+    def __bisect(self,word):
+        """
+            Position of the first vocabulary word >= word
+        """
+        lo, hi = 0, self.nwords
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.__word(mid) < word:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def lookup(self,keyword):
+        """
+            \brief Places with a word starting with keyword, preceded by a space
+            \param keyword Plain word, no spaces nor regular expression syntax
+            \return Set of place ids
+        """
+        self.check_keyword(keyword)
+
+        prefix = keyword.decode("utf-8").lower().encode("utf-8")
+        first = self.__bisect(prefix)
+        #0xff never appears in utf-8, every word with the prefix sorts before it
+        last = self.__bisect(prefix + "\xff")
+
+        start = struct.unpack_from("<Q", self.mm, self.__posting_offsets + 8 * first)[0]
+        end = struct.unpack_from("<Q", self.mm, self.__posting_offsets + 8 * last)[0]
+
+        ids = array.array("I")
+        ids.fromstring(self.mm[self.__postings + 4 * start:self.__postings + 4 * end])
+        if sys.byteorder != "little":
+            ids.byteswap()
+        return set(ids)
+
+    @staticmethod
+    def check_keyword(keyword):
+        """
+            \brief Raise ValueError unless keyword can be looked up: a plain word, no
+            spaces nor regular expression syntax
+        """
+        if re.search(r"[\s.^$*+?{}\[\]\\|()]", keyword):
+            raise ValueError("The abstract index only answers plain keywords, not '%s'" % keyword)
+
+    def query(self,query_list):
+        """
+            \brief Places whose abstract matches any of the keywords
+            \return Sorted list of place ids
+        """
+        ids = set()
+        for keyword in query_list:
+            ids.update(self.lookup(str(keyword)))
+        return sorted(ids)
+
+    @staticmethod
+    def words(abstract):
+        """
+            \brief Lowercased words of an abstract that follow a space
+        """
+        return set(abstract.decode("utf-8").lower().encode("utf-8").split(" ")[1:]) - set([""])
+
+    @classmethod
+    def build(cls,csvfilename,filename):
+        """
+            \brief Create the index from a dump generated by alldbpediapoints.py --abstracts
+            \return Number of indexed places
+        """
+        csv.field_size_limit(sys.maxsize)
+
+        countries = {}
+        country_ids = array.array("I")
+        places = []
+        postings = {}
+
+        with open(csvfilename, "rb") as csvfile:
+            for row in csv.DictReader(csvfile, delimiter=';', quotechar='"'):
+                abstract = row.get("abstract")
+                if not abstract or not row["country"]:
+                    continue
+
+                pid = len(places)
+                places.append("\t".join([row["name"].replace("\t", " "), row["x"], row["y"]]))
+                country_ids.append(countries.setdefault(row["country"], len(countries)))
+                for word in cls.words(abstract):
+                    postings.setdefault(word, array.array("I")).append(pid)
+
+        #countries are stored sorted, remap the ids
+        country_list = sorted(countries)
+        remap = dict((countries[c], i) for i, c in enumerate(country_list))
+        country_ids = array.array("I", (remap[c] for c in country_ids))
+
+        words = sorted(postings)
+        npostings = sum(len(postings[w]) for w in words)
+
+        with open(filename, "wb") as fileh:
+            fileh.write(cls.HEADER.pack(cls.MAGIC, len(places), len(country_list), len(words), npostings))
+            cls.__write_table(fileh, country_list)
+            cls.__write_array(fileh, country_ids)
+            cls.__write_table(fileh, places)
+            cls.__write_table(fileh, words)
+
+            cls.__write_offsets(fileh, [len(postings[w]) for w in words])
+            for w in words:
+                cls.__write_array(fileh, postings[w])
+
+        return len(places)
+
+    @staticmethod
+    def __write_array(fileh,values):
+        if sys.byteorder != "little":
+            values = array.array(values.typecode, values)
+            values.byteswap()
+        values.tofile(fileh)
+
+    @staticmethod
+    def __write_offsets(fileh,sizes):
+        """
+            Write the cumulative offsets (uint64) of a list of sizes
+        """
+        offsets = [0]
+        for size in sizes:
+            offsets.append(offsets[-1] + size)
+        fileh.write(struct.pack("<%dQ" % len(offsets), *offsets))
+
+    @classmethod
+    def __write_table(cls,fileh,strings):
+        """
+            Write a (offsets, heap) section
+        """
+        cls.__write_offsets(fileh, [len(s) for s in strings])
+        for s in strings:
+            fileh.write(s)
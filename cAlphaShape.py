@@ -0,0 +1,317 @@
+import math
+import numpy
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import Delaunay
+from scipy.spatial.qhull import QhullError
+from shapely.geometry import MultiPolygon, Point, Polygon
+
+class cAlphaShape():
+    """
+        \brief Alpha shapes of a point set, computed in process
+        \details Same definitions as the CGAL Alpha_shape_2 used by alpha_shaper, in
+        GENERAL mode: alpha is a squared radius, a triangle of the Delaunay triangulation
+        is interior when its squared circumradius is <= alpha, and the shape is the union
+        of the interior triangles. The triangulation and the alpha value of every
+        triangle and edge are computed once, in the constructor.
+    """
+
+    def __init__(self,lon,lat):
+        """
+            Class constructor. Triangulates the points
+            \param lon Sequence of longitudes
+            \param lat Sequence of latitudes
+        """
+        self.points = numpy.column_stack((numpy.asarray(lon, dtype=numpy.float64),
+                                          numpy.asarray(lat, dtype=numpy.float64)))
+        self.simplices = numpy.zeros((0, 3), dtype=numpy.intp)
+        self.neighbors = numpy.zeros((0, 3), dtype=numpy.intp)
+
+        #fewer than three distinct points, or all of them collinear, have no triangles
+        if len(self.points) >= 3 and len(numpy.unique(self.points, axis=0)) >= 3:
+            try:
+                triangulation = Delaunay(self.points)
+                self.simplices = triangulation.simplices
+                self.neighbors = triangulation.neighbors
+            except QhullError:
+                pass
+
+        self.face_alpha, self.ccw = self.__face_alphas()
+        self.edge_min = self.__edge_alphas()
+        self.spectrum = self.__spectrum()
+
+    def __face_alphas(self):
+        """
+            Squared circumradius of every triangle. Flat triangles get infinity
+            \return Tuple (alphas, True where the vertices are counterclockwise)
+        """
+        p = self.points[self.simplices[:, 0]]
+        q = self.points[self.simplices[:, 1]]
+        r = self.points[self.simplices[:, 2]]
+
+        a2 = ((q - r) ** 2).sum(axis=1)
+        b2 = ((p - r) ** 2).sum(axis=1)
+        c2 = ((p - q) ** 2).sum(axis=1)
+        cross = (q[:, 0] - p[:, 0]) * (r[:, 1] - p[:, 1]) - (q[:, 1] - p[:, 1]) * (r[:, 0] - p[:, 0])
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            alphas = a2 * b2 * c2 / (4 * cross * cross)
+        alphas[~numpy.isfinite(alphas)] = numpy.inf
+        return alphas, cross > 0
+
+    def __edge_alphas(self):
+        """
+            Smallest alpha of the edges that are in the shape on their own (singular)
+            \details An edge exists from the squared radius of its smallest circle
+            (half its length squared), unless the third vertex of one of its triangles
+            is inside that circle. Those edges are only in the shape with a triangle.
+            \return Array with the defined values, one per edge
+        """
+        if len(self.simplices) == 0:
+            return numpy.zeros(0)
+
+        faces, opposite = numpy.nonzero((self.neighbors == -1) |
+                                        (numpy.arange(len(self.simplices))[:, None] < self.neighbors))
+        p = self.points[self.simplices[faces, (opposite + 1) % 3]]
+        q = self.points[self.simplices[faces, (opposite + 2) % 3]]
+
+        attached = self.__inside_diametral(p, q, self.points[self.simplices[faces, opposite]])
+        inner = self.neighbors[faces, opposite]
+        shared = inner != -1
+        other = self.simplices[inner[shared]]
+        #vertex of the neighbour that is not on the edge
+        third = other.sum(axis=1) - self.simplices[faces[shared], (opposite[shared] + 1) % 3] \
+                                  - self.simplices[faces[shared], (opposite[shared] + 2) % 3]
+        attached[shared] |= self.__inside_diametral(p[shared], q[shared], self.points[third])
+
+        return (((p - q) ** 2).sum(axis=1) / 4)[~attached]
+
+    @staticmethod
+    def __inside_diametral(p,q,r):
+        """
+            True where r is strictly inside the circle of diameter pq
+        """
+        return ((p - r) * (q - r)).sum(axis=1) < 0
+
+    def __spectrum(self):
+        """
+            Sorted alpha values where the shape changes
+        """
+        values = numpy.concatenate((self.face_alpha[numpy.isfinite(self.face_alpha)], self.edge_min))
+        return numpy.unique(values)
+
+    def interior(self,alpha):
+        """
+            \brief Triangles of the shape
+            \return Boolean array, one per triangle
+        """
+        return self.face_alpha <= alpha
+
+    def solid_components(self,alpha):
+        """
+            \brief Number of connected groups of interior triangles, sharing edges
+        """
+        inside = self.interior(alpha)
+        count = int(inside.sum())
+        if count == 0:
+            return 0
+
+        faces, opposite = numpy.nonzero(self.neighbors != -1)
+        links = inside[faces] & inside[self.neighbors[faces, opposite]]
+        graph = coo_matrix((numpy.ones(int(links.sum())), (faces[links], self.neighbors[faces[links], opposite[links]])),
+                           shape=(len(self.simplices), len(self.simplices)))
+        total = connected_components(graph, directed=False)[0]
+        #every exterior triangle is a component of its own
+        return total - (len(self.simplices) - count)
+
+    def solid_alpha(self):
+        """
+            \brief Smallest alpha with every point in the interior or on the boundary
+            \details The largest, over the points, of the smallest alpha of their triangles
+        """
+        if len(self.points) < 3 or len(self.spectrum) == 0:
+            return 0
+
+        smallest = numpy.full(len(self.points), self.spectrum[-1])
+        for k in range(3):
+            numpy.minimum.at(smallest, self.simplices[:, k], self.face_alpha)
+
+        #duplicated points are left out of the triangulation
+        used = numpy.zeros(len(self.points), dtype=bool)
+        used[self.simplices.ravel()] = True
+        return smallest[used].max()
+
+    def optimal_alpha(self,components=1):
+        """
+            \brief Alpha giving a solid shape of at most components parts
+            \details Follows CGAL find_optimal_alpha: binary search in the spectrum,
+            starting at solid_alpha(), for the first value with at most components
+            solid components. Like CGAL, the value after that one is returned.
+            \return Alpha value, 0 for point sets without triangles
+        """
+        if len(self.spectrum) == 0:
+            return 0
+
+        alpha = self.solid_alpha()
+        first = int(numpy.searchsorted(self.spectrum, alpha))
+        end = len(self.spectrum)
+
+        if self.solid_components(alpha) != components:
+            length = end - first - 1
+            while length > 0:
+                half = length // 2
+                middle = first + half
+                if self.solid_components(self.spectrum[middle]) > components:
+                    first = middle + 1
+                    length = length - half - 1
+                else:
+                    length = half
+
+        if first + 1 < end:
+            first += 1
+        return float(self.spectrum[min(first, end - 1)])
+
+    def boundary(self,alpha):
+        """
+            \brief Edges between interior and exterior triangles
+            \details Oriented with the interior on their left, so outer rings run
+            counterclockwise and holes clockwise.
+            \return Tuple of arrays (start vertex, end vertex, interior triangle, side)
+        """
+        inside = self.interior(alpha)
+        outside = (self.neighbors == -1) | ~inside[self.neighbors]
+        faces, opposite = numpy.nonzero(inside[:, None] & outside)
+
+        start = self.simplices[faces, (opposite + 1) % 3]
+        end = self.simplices[faces, (opposite + 2) % 3]
+        clockwise = ~self.ccw[faces]
+        start[clockwise], end[clockwise] = end[clockwise], start[clockwise].copy()
+        return start, end, faces, opposite
+
+    def rings(self,alpha):
+        """
+            \brief Boundary of the shape as simple closed rings
+            \details Each edge is followed by the next one around the same interior
+            corner: where several rings touch at a vertex (pinch), the outgoing edge
+            closest clockwise to the incoming one is taken, so rings never cross nor
+            share edges. A traced ring going twice through a vertex (a hole touching its
+            outer ring) is then cut there into simple rings.
+            \return Tuple (list of rings as lists of boundary edge ids, boundary() arrays)
+        """
+        start, end, faces, opposite = edges = self.boundary(alpha)
+
+        outgoing = {}
+        for i, v in enumerate(start.tolist()):
+            outgoing.setdefault(v, []).append(i)
+
+        used = numpy.zeros(len(start), dtype=bool)
+        rings = []
+        for first in range(len(start)):
+            if used[first]:
+                continue
+
+            ring = []
+            current = first
+            while not used[current]:
+                used[current] = True
+                ring.append(current)
+
+                v = end[current]
+                candidates = outgoing[v]
+                if len(candidates) == 1:
+                    current = candidates[0]
+                else:
+                    current = self.__next_edge(start[current], v, [end[c] for c in candidates], candidates)
+            rings.extend(self.__simple_rings(ring, start))
+
+        return rings, edges
+
+    @staticmethod
+    def __simple_rings(ring,start):
+        """
+            Cut a closed ring of edge ids at its repeated vertices
+        """
+        rings = []
+        stack = []
+        position = {}
+        for edge in ring + ring[:1]:
+            v = start[edge]
+            if v in position:
+                i = position[v]
+                rings.append(stack[i:])
+                for cut in stack[i:]:
+                    del position[start[cut]]
+                stack = stack[:i]
+            position[v] = len(stack)
+            stack.append(edge)
+        return rings
+
+    def __next_edge(self,previous,vertex,targets,candidates):
+        """
+            Outgoing edge of a pinch vertex bounding the same interior corner as the
+            incoming edge previous -> vertex
+        """
+        px, py = self.points[vertex]
+        back = math.atan2(self.points[previous][1] - py, self.points[previous][0] - px)
+
+        best = None
+        for target, candidate in zip(targets, candidates):
+            angle = (back - math.atan2(self.points[target][1] - py, self.points[target][0] - px)) % (2 * math.pi)
+            if angle == 0:
+                #going back along the incoming edge
+                angle = 2 * math.pi
+            if best is None or angle < best[0]:
+                best = (angle, candidate)
+        return best[1]
+
+    def shape(self,alpha):
+        """
+            \brief Alpha shape polygons
+            \details Outer rings counterclockwise, holes clockwise, as alpha_shaper
+            writes them. A hole belongs to the smallest outer ring around it. Edges and
+            points outside any interior triangle are left out, alpha_shaper does not
+            write them as polygons either.
+            \return shapely MultiPolygon, empty if no triangle is interior
+        """
+        rings, (start, end, faces, opposite) = self.rings(alpha)
+
+        shells = []
+        holes = []
+        for ring in rings:
+            coords = self.points[numpy.append(start[ring], end[ring[-1]])]
+            x = coords[:, 0]
+            y = coords[:, 1]
+            area = (x[:-1] * y[1:] - x[1:] * y[:-1]).sum() / 2
+            if area > 0:
+                shells.append((coords, area))
+            elif area < 0:
+                #a point of the hole: centroid of the exterior triangle across its first edge
+                outer = self.neighbors[faces[ring[0]], opposite[ring[0]]]
+                holes.append((coords, self.points[self.simplices[outer]].mean(axis=0)))
+
+        if not shells:
+            return MultiPolygon()
+
+        #bounding boxes of the outer rings select the candidates of each hole
+        boxes = numpy.array([numpy.concatenate((c.min(axis=0), c.max(axis=0))) for c, area in shells])
+        order = numpy.argsort([area for c, area in shells])
+        polygons = [Polygon(c) for c, area in shells]
+        shell_holes = [[] for c in shells]
+
+        for coords, (hx, hy) in holes:
+            inbox = (boxes[:, 0] <= hx) & (hx <= boxes[:, 2]) & (boxes[:, 1] <= hy) & (hy <= boxes[:, 3])
+            for i in order:
+                if inbox[i] and polygons[i].contains(Point(hx, hy)):
+                    shell_holes[i].append(coords)
+                    break
+
+        return MultiPolygon([Polygon(c, shell_holes[i]) for i, (c, area) in enumerate(shells)])
+
+    def sweep(self,alphas):
+        """
+            \brief Alpha shapes for several alphas on the same triangulation
+            \param alphas Sequence of alpha values
+            \return Generator of (alpha, shapely MultiPolygon), in the given order
+        """
+        for alpha in alphas:
+            yield alpha, self.shape(alpha)
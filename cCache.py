@@ -0,0 +1,156 @@
+import hashlib
+import os
+import re
+import tempfile
+import time
+
+#SPARQL string literals: long ones first, escapes included
+LITERAL = re.compile(r'("""(?:[^"\\]|\\.|"(?!""))*"""'
+                     r"|'''(?:[^'\\]|\\.|'(?!''))*'''"
+                     r'|"(?:[^"\\\n]|\\.)*"'
+                     r"|'(?:[^'\\\n]|\\.)*')", re.S)
+
+class cCache():
+    """
+        \brief Persistent on-disk cache of SPARQL responses
+        \details Responses are stored raw, one file per query, named after the hash of the
+        endpoint and the normalized query text. Entries older than the TTL are ignored and
+        the least recently used ones are evicted when the cache grows over its size bound.
+        The modification time of an entry is its creation time (TTL), the access time is
+        its last use (LRU).
+    """
+
+    def __init__(self,directory,ttl=None,max_bytes=None,refresh=False):
+        """
+            Class constructor
+            \param directory Where to store the responses. Created if missing
+            \param ttl Seconds an entry stays valid. None for no expiration
+            \param max_bytes Size bound of the cache. None for no bound
+            \param refresh Ignore stored entries, but store the new responses
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.evict()
+
+    def key(self,endpoint,query,fmt="json"):
+        """
+            \brief Content address of a query
+            \details Whitespace is collapsed so reformatting a query does not miss the cache.
+            String literals (keywords, regular expressions) are kept as they are
+            \param endpoint Endpoint URL
+            \param query SPARQL query text
+            \param fmt Format of the response (json, csv...)
+        """
+        parts = LITERAL.split(query)
+        #odd parts are the literals
+        for i in range(0, len(parts), 2):
+            parts[i] = re.sub(r"\s+", " ", parts[i])
+        normalized = "".join(parts).strip()
+        return hashlib.sha1(endpoint + "\n" + fmt + "\n" + normalized).hexdigest()
+
+    def __path(self,key):
+        return os.path.join(self.directory, key)
+
+    def open(self,key):
+        """
+            \brief Open a stored response for reading
+            \return File handle or None if missing, expired or refreshing
+        """
+        if self.refresh:
+            return None
+
+        path = self.__path(key)
+        try:
+            created = os.path.getmtime(path)
+            if self.ttl is not None and time.time() - created > self.ttl:
+                os.remove(path)
+                return None
+
+            fileh = open(path, "rb")
+            os.utime(path, (time.time(), created))
+            return fileh
+        except (OSError, IOError):
+            return None
+
+    def get(self,key):
+        """
+            \brief Retrieve a stored response
+            \return The raw response or None if missing, expired or refreshing
+        """
+        fileh = self.open(key)
+        if fileh is None:
+            return None
+
+        with fileh:
+            return fileh.read()
+
+    def create(self,key):
+        """
+            \brief Start storing a response that is written progressively
+            \return File handle to write to. Finish with commit() or discard()
+        """
+        fd, tmpname = tempfile.mkstemp(dir=self.directory, prefix=".tmp")
+        os.close(fd)
+        return open(tmpname, "wb")
+
+    def commit(self,key,fileh):
+        """
+            \brief Make a response written through create() available
+        """
+        fileh.close()
+        os.rename(fileh.name, self.__path(key))
+
+        self.evict()
+
+    def discard(self,fileh):
+        """
+            \brief Drop an incomplete response written through create()
+        """
+        fileh.close()
+        try:
+            os.remove(fileh.name)
+        except OSError:
+            pass
+
+    def put(self,key,data):
+        """
+            \brief Store a raw response and evict entries over the size bound
+        """
+        fileh = self.create(key)
+        fileh.write(data)
+        self.commit(key, fileh)
+
+    def evict(self):
+        """
+            \brief Remove the least recently used entries until the cache fits in max_bytes
+        """
+        if self.max_bytes is None:
+            return
+
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if name.startswith(".tmp"):
+                continue
+            try:
+                st = os.stat(self.__path(name))
+            except OSError:
+                continue
+            entries.append((st.st_atime, st.st_size, name))
+            total += st.st_size
+
+        entries.sort()
+        for atime, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self.__path(name))
+            except OSError:
+                pass
+            total -= size
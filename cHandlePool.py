@@ -0,0 +1,84 @@
+import csv
+
+class cHandlePool():
+    """
+        \brief Bounded pool of open CSV output files, one per key
+        \details Rows are buffered per key and written batch rows at a time. At most
+        max_open files are open: when a new one is needed the least recently written is
+        closed, and it is reopened in append mode the next time its key is flushed, so
+        any number of outputs can be written in one pass without running out of file
+        descriptors, and interleaved keys do not reopen a file for every row. A file is
+        truncated and gets the header the first time its key is flushed.
+    """
+
+    def __init__(self,path,header,max_open=64,batch=1000,**csvargs):
+        """
+            Class constructor
+            \param path Function key -> file name
+            \param header Text written first in every file
+            \param max_open Largest number of files open at the same time
+            \param batch Rows kept in memory per key before they are written
+            \param csvargs Arguments of csv.writer
+        """
+        self.path = path
+        self.header = header
+        self.max_open = max(1, max_open)
+        self.batch = max(1, batch)
+        self.csvargs = csvargs
+        self.open = {}
+        #last write of every open key, the smallest one is closed first
+        self.used = {}
+        self.tick = 0
+        self.seen = set()
+        self.buffers = {}
+
+    def writerow(self,key,row):
+        """
+            \brief Add a row to the file of a key
+        """
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            buffer = self.buffers[key] = []
+        buffer.append(row)
+        if len(buffer) >= self.batch:
+            self.__flush(key)
+
+    def __flush(self,key):
+        """
+            Write the buffered rows of a key, opening its file if needed
+        """
+        self.tick += 1
+        entry = self.open.get(key)
+        if entry is None:
+            if len(self.open) >= self.max_open:
+                oldest = min(self.used, key=self.used.get)
+                self.open.pop(oldest)[0].close()
+                del self.used[oldest]
+
+            if key in self.seen:
+                handle = open(self.path(key), 'ab')
+            else:
+                handle = open(self.path(key), 'wb')
+                handle.write(self.header)
+                self.seen.add(key)
+            entry = self.open[key] = (handle, csv.writer(handle, **self.csvargs))
+
+        self.used[key] = self.tick
+        entry[1].writerows(self.buffers.pop(key))
+
+    def keys(self):
+        """
+            \brief Keys with rows so far
+        """
+        return self.seen.union(self.buffers)
+
+    def close(self):
+        """
+            \brief Write the buffered rows and close every open file
+        """
+        for key in list(self.buffers):
+            self.__flush(key)
+        for handle, writer in self.open.values():
+            handle.close()
+        self.open = {}
+        self.used = {}
@@ -0,0 +1,53 @@
+import json
+import os
+
+class cJournal():
+    """
+        \brief Checkpoint journal of a long running dump
+        \details Records, after each committed page, where the next page starts and how
+        many bytes of the output file are valid. A dump can then be resumed from the last
+        committed page instead of starting from zero.
+    """
+
+    def __init__(self,filename):
+        """
+            Class constructor
+            \param filename Path of the journal file
+        """
+        self.filename = filename
+        self.state = {}
+
+    def exists(self):
+        """
+            \brief True if a journal from a previous run is present
+        """
+        return os.path.exists(self.filename)
+
+    def load(self):
+        """
+            \brief Read the journal file
+            \return Dictionary with the last committed state
+        """
+        with open(self.filename, "rb") as fileh:
+            self.state = json.load(fileh)
+        return self.state
+
+    def get(self,key,default=None):
+        """
+            \brief Value of the last committed state
+        """
+        return self.state.get(key, default)
+
+    def commit(self,**state):
+        """
+            \brief Record a new state. Only keys given are updated.
+            \details The journal is written to a temporary file and renamed over
+            the previous one, so a crash never leaves a half written journal.
+        """
+        self.state.update(state)
+        tmpname = self.filename + ".tmp"
+        with open(tmpname, "wb") as fileh:
+            json.dump(self.state, fileh)
+            fileh.flush()
+            os.fsync(fileh.fileno())
+        os.rename(tmpname, self.filename)
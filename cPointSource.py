@@ -0,0 +1,428 @@
+from SPARQLWrapper import SPARQLWrapper, JSON
+from multiprocessing.pool import ThreadPool
+import csv
+import re
+import sqlite3
+import sys
+import warnings
+
+import cPlace
+import sparql_functions as SPARQLF
+from cAbstractIndex import cAbstractIndex
+
+SOURCES = ["sparql", "csv", "sqlite", "index"]
+
+class cPointSource():
+    """
+        \brief Where the places of a query come from
+        \details A point source lists the countries it knows about and retrieves the places
+        of a set of countries whose abstract matches any of the query keywords.
+        Keywords are interpreted as in the DBpedia queries: the regular expression
+        " keyword", case insensitive, searched in the abstract.
+    """
+
+    def countries(self):
+        """
+            \brief Countries that can be queried
+            \return List with country URIs
+        """
+        raise NotImplementedError
+
+    def fetch(self,country_uris,query_list):
+        """
+            \brief Retrieve the places of the countries matching the keywords
+            \param country_uris countries to query
+            \param query_list keywords to look for in the abstract. Logical disjunction
+            \return List of (country_uri, list of @ref cPlace), in the country_uris order
+        """
+        raise NotImplementedError
+
+
+def keyword_pattern(query_list):
+    """
+        Regular expression equivalent to the DBpedia abstract FILTER, to be used case insensitive
+    """
+    return "|".join("(?: " + str(q) + ")" for q in query_list)
+
+def regexp(pattern,item):
+    """
+        REGEXP function for SQLite, case insensitive
+    """
+    return item is not None and re.search(pattern, item, re.IGNORECASE) is not None
+
+def new_place(title,lat,lon,country_uri):
+    """
+        Build a place as the SPARQL source does, so all sources give the same output.
+        \return @ref cPlace or None if the coordinates are not valid
+    """
+    if lat == 'NAN' or lon == 'NAN':
+        return None
+    #abstracts are not carried to the places (see fetch_country in SPARQL)
+    return cPlace.cPlace(title.encode('ascii','ignore'),lat.encode('ascii','ignore'),
+                         lon.encode('ascii','ignore'),"",country_uri.rpartition('/')[-1])
+
+
+class cSparqlPointSource(cPointSource):
+    """
+        \brief Places retrieved live from a DBpedia SPARQL endpoint
+    """
+
+    def __init__(self,endpoint,cache=None,workers=4,batch_size=0,results_query=500000,spinner=None):
+        """
+            Class constructor
+            \param endpoint SPARQL endpoint URL
+            \param cache @ref cCache for the responses or None
+            \param workers Countries (or batches) fetched concurrently
+            \param batch_size Countries bound in a single VALUES query. 0 for one query per country
+            \param results_query LIMIT of each query
+            \param spinner @ref cSpinner to show progress or None
+        """
+        self.endpoint = endpoint
+        self.cache = cache
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.results_query = results_query
+        self.spinner = spinner
+        self.query_list = []
+
+    def __msg(self,text):
+        if self.spinner is not None:
+            self.spinner.set_msg(text)
+
+    def new_sparql(self):
+        """
+            Create a new SPARQLWrapper pointing to the endpoint.
+            \details SPARQLWrapper keeps the query as internal state, so each worker thread needs its own instance.
+            \return SPARQLWrapper
+        """
+        return SPARQLWrapper(self.endpoint)
+
+    def countries(self):
+        """
+            Retrieve an europe country list from DBpedia with URIs.
+            @return List with country URIS
+        """
+        sparql = self.new_sparql()
+        sparql.setReturnFormat(JSON)
+
+        results = SPARQLF.run_query(sparql, """
+                        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+                        PREFIX yago: <http://dbpedia.org/class/yago/>
+                        PREFIX dbo: <http://dbpedia.org/ontology/>
+
+                        SELECT DISTINCT ?place WHERE {
+                            ?place rdf:type yago:EuropeanCountries .
+                            ?place rdf:type dbo:Country
+                        }
+                        """,
+                        self.cache)
+
+        if not isinstance(results, dict):
+            warnings.warn("Parsing Failure. Not a dictionary")
+            return []
+
+        return [country["place"]["value"] for country in results["results"]["bindings"]]
+
+    def fetch(self,country_uris,query_list):
+        """
+            \brief Retrieve the places of the countries matching the keywords
+            \details Countries are fetched concurrently, but merged in the country_uris
+            order so the points file and the report do not depend on network timing.
+        """
+        self.query_list = query_list
+
+        #get() with a timeout keeps the main thread responsive to SIGINT.
+        pool = ThreadPool(self.workers)
+        try:
+            if self.batch_size > 0:
+                batches = [country_uris[i:i + self.batch_size] for i in range(0, len(country_uris), self.batch_size)]
+                fetched = []
+                for batch in pool.map_async(self.fetch_batch, batches, 1).get(0xFFFF):
+                    fetched.extend(batch)
+            else:
+                fetched = pool.map_async(self.fetch_country, country_uris, 1).get(0xFFFF)
+        finally:
+            pool.close()
+
+        return fetched
+
+    def abstract_filter(self):
+        """
+            SPARQL FILTER expression matching any of the keywords in the abstract
+        """
+        regex_list = []
+        for q in self.query_list:
+            regex_list.append("""regex(?abstract,\" """+str(q)+"""\","i") """)
+
+        return "||".join(regex_list)
+
+    def get_points(self,country_uri,offset,limit,endpoint):
+        """
+            Retrieve a list of points from DBpedia matching the input.
+            \param country_uri country to query
+            \param offset Offset to start retrieving
+            \param limit Limit of lines to retrieve
+            \param endpoint SPARQLWrapper to use
+            \return Generator of rows with title,geolat,geolong, yielded as they arrive
+        """
+        querystr = """
+            SELECT DISTINCT ?title,?geolat,?geolong
+            WHERE{
+              ?place rdf:type dbo:Place .
+              ?place dbo:country <""" + country_uri + """> .
+              ?place foaf:name ?title .
+              ?place geo:lat ?geolat .
+              ?place geo:long ?geolong .
+              ?place dbo:abstract ?abstract .
+              FILTER ("""+ self.abstract_filter() +""")
+            }
+            OFFSET """ + str(offset) + """
+            LIMIT """ + str(limit)+ """
+            """
+
+        return SPARQLF.stream_query(endpoint, querystr, self.cache)
+
+    def get_points_batch(self,country_uris,limit,endpoint):
+        """
+            Retrieve the points of several countries with a single query.
+            \param country_uris countries to query, bound with VALUES
+            \param limit Limit of lines to retrieve
+            \param endpoint SPARQLWrapper to use
+            \return Generator of rows with country,title,geolat,geolong, yielded as they arrive
+        """
+        values = " ".join("<" + uri + ">" for uri in country_uris)
+
+        querystr = """
+            SELECT DISTINCT ?country,?title,?geolat,?geolong
+            WHERE{
+              VALUES ?country { """ + values + """ }
+              ?place rdf:type dbo:Place .
+              ?place dbo:country ?country .
+              ?place foaf:name ?title .
+              ?place geo:lat ?geolat .
+              ?place geo:long ?geolong .
+              ?place dbo:abstract ?abstract .
+              FILTER ("""+ self.abstract_filter() +""")
+            }
+            LIMIT """ + str(limit)+ """
+            """
+
+        return SPARQLF.stream_query(endpoint, querystr, self.cache)
+
+    def fetch_country(self,country_uri):
+        """
+            Retrieve all the places of a country, paging through the results.
+            \details Executed by the worker pool, one call per country.
+            \param country_uri Country to query
+            \return Tuple (country_uri, list of @ref cPlace)
+        """
+        endpoint = self.new_sparql()
+        places = []
+        offset = 0
+        query_results = 1
+
+        self.__msg(country_uri.rpartition('/')[-1])
+
+        while query_results > 0:
+            #places of a page are kept apart until the page is complete, a
+            #failed page is fetched again from its start
+            page = []
+            query_results = 0
+            try:
+                for result in self.get_points(country_uri,offset,self.results_query,endpoint):
+                    query_results += 1
+                    place = new_place(result["title"],result["geolat"],result["geolong"],country_uri)
+                    if place is not None:
+                        page.append(place)
+
+                places.extend(page)
+                offset = offset + query_results
+            except Exception as inst:
+                print type(inst)
+                print "EXCEPTION"
+                query_results = 1
+
+        return country_uri, places
+
+    def fetch_batch(self,country_uris):
+        """
+            Retrieve all the places of a batch of countries with VALUES queries.
+            \details Executed by the worker pool, one call per batch. A batch whose
+            query hits the results limit is split in two halves and each one is queried
+            again. A single country hitting the limit is paged by fetch_country().
+            \param country_uris Countries to query
+            \return List of (country_uri, list of @ref cPlace), in the batch order
+        """
+        if len(country_uris) == 1:
+            return [self.fetch_country(country_uris[0])]
+
+        endpoint = self.new_sparql()
+
+        self.__msg(", ".join(uri.rpartition('/')[-1] for uri in country_uris))
+
+        while True:
+            places = dict((uri, []) for uri in country_uris)
+            query_results = 0
+            try:
+                for result in self.get_points_batch(country_uris,self.results_query,endpoint):
+                    query_results += 1
+                    place = new_place(result["title"],result["geolat"],result["geolong"],result["country"])
+                    if place is not None:
+                        places[result["country"]].append(place)
+                break
+            except Exception as inst:
+                print type(inst)
+                print "EXCEPTION"
+
+        if query_results >= self.results_query:
+            half = len(country_uris) // 2
+            return self.fetch_batch(country_uris[:half]) + self.fetch_batch(country_uris[half:])
+
+        return [(uri, places[uri]) for uri in country_uris]
+
+
+class cLocalPointSource(cPointSource):
+    """
+        \brief Common behaviour of the sources reading a local copy of DBpedia
+        \details Subclasses provide rows(), the (title, country, lat, lon) of the places whose
+        abstract matches. Like the SPARQL queries, places are DISTINCT by title and coordinates
+        within a country.
+    """
+
+    def rows(self,country_uris,query_list):
+        """
+            \brief Rows (title, country, lat, lon) of the places matching the keywords
+            \details May also return places of other countries, they are filtered out by fetch()
+        """
+        raise NotImplementedError
+
+    def fetch(self,country_uris,query_list):
+        places = dict((uri, []) for uri in country_uris)
+        seen = set()
+
+        for title, country, lat, lon in self.rows(country_uris,query_list):
+            if country not in places or (title, country, lat, lon) in seen:
+                continue
+            seen.add((title, country, lat, lon))
+
+            place = new_place(title,lat,lon,country)
+            if place is not None:
+                places[country].append(place)
+
+        return [(uri, places[uri]) for uri in country_uris]
+
+
+class cCsvPointSource(cLocalPointSource):
+    """
+        \brief Places read from a dump generated by alldbpediapoints.py --abstracts
+        \details csv file is expected: name;country;URL;x;y;WKT;abstract
+        with x the latitude and y the longitude.
+    """
+
+    def __init__(self,filename):
+        """
+            Class constructor
+            \param filename Path of the dump
+        """
+        self.filename = filename
+        csv.field_size_limit(sys.maxsize)
+
+    def __reader(self):
+        with open(self.filename, 'rb') as csvfile:
+            for row in csv.DictReader(csvfile, delimiter=';', quotechar='"'):
+                yield row
+
+    def countries(self):
+        countries = set()
+        for row in self.__reader():
+            if "http://dbpedia.org/resource/" in (row["country"] or ""):
+                countries.add(row["country"])
+        return sorted(countries)
+
+    def rows(self,country_uris,query_list):
+        regex = re.compile(keyword_pattern(query_list), re.IGNORECASE)
+        for row in self.__reader():
+            abstract = (row.get("abstract") or "").decode("utf-8")
+            if abstract and regex.search(abstract):
+                yield (row["name"].decode("utf-8"), row["country"],
+                       row["x"].decode("utf-8"), row["y"].decode("utf-8"))
+
+
+class cSqlitePointSource(cLocalPointSource):
+    """
+        \brief Places read from an SQLite database built with sqlite_points.py
+        \details Table places(name, country, url, lat, lon, abstract), indexed by country.
+    """
+
+    def __init__(self,filename):
+        """
+            Class constructor
+            \param filename Path of the database
+        """
+        self.filename = filename
+
+    def countries(self):
+        conn = sqlite3.connect(self.filename)
+        try:
+            return [row[0] for row in conn.execute("SELECT DISTINCT country FROM places ORDER BY country")]
+        finally:
+            conn.close()
+
+    def rows(self,country_uris,query_list):
+        conn = sqlite3.connect(self.filename)
+        conn.create_function("REGEXP", 2, regexp)
+        try:
+            marks = ",".join("?" * len(country_uris))
+            cursor = conn.execute("SELECT name, country, lat, lon FROM places "
+                                  "WHERE country IN (" + marks + ") AND abstract REGEXP ?",
+                                  list(country_uris) + [keyword_pattern(query_list)])
+            for row in cursor:
+                yield row
+        finally:
+            conn.close()
+
+    @staticmethod
+    def build(csvfilename,filename):
+        """
+            \brief Create the database from a dump generated by alldbpediapoints.py --abstracts
+            \return Number of rows imported
+        """
+        csv.field_size_limit(sys.maxsize)
+        conn = sqlite3.connect(filename)
+        conn.execute("DROP TABLE IF EXISTS places")
+        conn.execute("CREATE TABLE places (name TEXT, country TEXT, url TEXT, lat TEXT, lon TEXT, abstract TEXT)")
+
+        total = [0]
+        def rows():
+            with open(csvfilename, 'rb') as csvfile:
+                for row in csv.DictReader(csvfile, delimiter=';', quotechar='"'):
+                    total[0] += 1
+                    yield [(row.get(key) or "").decode("utf-8") for key in ("name", "country", "URL", "x", "y", "abstract")]
+
+        conn.executemany("INSERT INTO places VALUES (?,?,?,?,?,?)", rows())
+        conn.execute("CREATE INDEX places_country ON places (country)")
+        conn.commit()
+        conn.close()
+        return total[0]
+
+
+class cIndexPointSource(cLocalPointSource):
+    """
+        \brief Places answered by an inverted index of the abstracts built with abstract_index.py
+        \details Only plain keywords are supported (no regular expressions nor spaces).
+    """
+
+    def __init__(self,filename):
+        """
+            Class constructor
+            \param filename Path of the index
+        """
+        self.index = cAbstractIndex(filename)
+
+    def countries(self):
+        return self.index.countries()
+
+    def rows(self,country_uris,query_list):
+        for pid in self.index.query(query_list):
+            title, country, lat, lon = self.index.place(pid)
+            yield title.decode("utf-8"), country, lat.decode("utf-8"), lon.decode("utf-8")
@@ -0,0 +1,201 @@
+import array
+import csv
+import math
+import struct
+import sys
+
+import numpy
+
+class cPointStore():
+    """
+        \brief Memory-mapped columnar store of the places of a dump
+        \details Built once from a dump generated by alldbpediapoints.py, so the tools do
+        not parse the text CSV nor the WKT again. Places are stored grouped by country (in
+        dump order within a country): the places of a country are a contiguous range and
+        its coordinates are two array slices, read straight from the mapped file.
+        Only places with a DBpedia country resource and finite coordinates are stored.
+
+        File layout (little endian), every section starts at a multiple of 8 bytes:
+        - header: magic, then number of places and countries (uint64)
+        - country table: offsets (uint64, countries+1) and utf-8 heap of sorted URIs
+        - country starts: first place of every country (uint64, countries+1)
+        - lon, lat (float64, places)
+        - place country ids (uint32, places)
+        - name table: offsets (uint64, places+1) and utf-8 heap
+        - URL table: offsets (uint64, places+1) and utf-8 heap
+    """
+    MAGIC = "VPPTS001"
+    HEADER = struct.Struct("<8s2Q")
+
+    def __init__(self,filename):
+        """
+            Class constructor. Maps a store built with build()
+            \param filename Path of the store file
+        """
+        self.filename = filename
+        self.data = numpy.memmap(filename, dtype=numpy.uint8, mode="r")
+
+        magic, self.nplaces, self.ncountries = self.HEADER.unpack(self.data[:self.HEADER.size].tostring())
+        if magic != self.MAGIC:
+            raise ValueError("%s is not a point store" % filename)
+
+        pos = self.HEADER.size
+        self.__countries, pos = self.__table(pos, self.ncountries)
+        self.starts, pos = self.__array(pos, "<u8", self.ncountries + 1)
+        self.lon, pos = self.__array(pos, "<f8", self.nplaces)
+        self.lat, pos = self.__array(pos, "<f8", self.nplaces)
+        self.country_ids, pos = self.__array(pos, "<u4", self.nplaces)
+        self.__names, pos = self.__table(pos, self.nplaces)
+        self.__urls, pos = self.__table(pos, self.nplaces)
+
+        self.__index = dict((uri, i) for i, uri in enumerate(self.countries()))
+
+    def __array(self,pos,dtype,count):
+        """
+            View of a numeric section
+            \return (array, position after the section)
+        """
+        size = numpy.dtype(dtype).itemsize * count
+        return self.data[pos:pos + size].view(dtype), _align(pos + size)
+
+    def __table(self,pos,count):
+        """
+            Locate a (offsets, heap) section
+            \return ((offsets array, heap position), position after the section)
+        """
+        offsets, heap = self.__array(pos, "<u8", count + 1)
+        return (offsets, heap), _align(heap + int(offsets[-1]))
+
+    def __string(self,table,i):
+        offsets, heap = table
+        return self.data[heap + int(offsets[i]):heap + int(offsets[i + 1])].tostring()
+
+    def close(self):
+        self.data = self.starts = self.lon = self.lat = self.country_ids = None
+
+    def countries(self):
+        """
+            \brief Country URIs of the stored places, sorted
+        """
+        return [self.__string(self.__countries, i) for i in range(self.ncountries)]
+
+    def counts(self):
+        """
+            \brief Number of places of every country, in the countries() order
+            \return numpy array
+        """
+        return numpy.diff(self.starts).astype(numpy.int64)
+
+    def country_range(self,country_uri):
+        """
+            \brief Ids of the places of a country
+            \return (first, last + 1). Empty for unknown countries
+        """
+        i = self.__index.get(country_uri)
+        if i is None:
+            return 0, 0
+        return int(self.starts[i]), int(self.starts[i + 1])
+
+    def coordinates(self,country_uri):
+        """
+            \brief Coordinates of the places of a country, without copying them
+            \return Tuple (lon array, lat array)
+        """
+        start, end = self.country_range(country_uri)
+        return self.lon[start:end], self.lat[start:end]
+
+    def place(self,i):
+        """
+            \brief Place of an id
+            \return Tuple (name, country_uri, URL, lat, lon)
+        """
+        country = self.__string(self.__countries, int(self.country_ids[i]))
+        return (self.__string(self.__names, i), country, self.__string(self.__urls, i),
+                float(self.lat[i]), float(self.lon[i]))
+
+    @classmethod
+    def build(cls,csvfilename,filename):
+        """
+            \brief Create the store from a dump generated by alldbpediapoints.py
+            \details csv file is expected: name;country;URL;x;y;WKT[;abstract]
+            with x the latitude and y the longitude.
+            \return Tuple (stored places, skipped rows)
+        """
+        csv.field_size_limit(sys.maxsize)
+
+        countries = {}
+        country_ids = array.array("I")
+        lon = array.array("d")
+        lat = array.array("d")
+        names = []
+        urls = []
+        skipped = 0
+
+        with open(csvfilename, "rb") as csvfile:
+            reader = csv.reader(csvfile, delimiter=';', quotechar='"')
+            header = next(reader)
+            iname, icountry, iurl, ix, iy = [header.index(c) for c in ("name", "country", "URL", "x", "y")]
+            last = max(iname, icountry, iurl, ix, iy)
+            for row in reader:
+                try:
+                    if len(row) <= last or "http://dbpedia.org/resource/" not in row[icountry]:
+                        raise ValueError
+                    x = float(row[ix])
+                    y = float(row[iy])
+                    if math.isinf(x) or math.isinf(y) or x != x or y != y:
+                        raise ValueError
+                except ValueError:
+                    skipped += 1
+                    continue
+                lat.append(x)
+                lon.append(y)
+                country_ids.append(countries.setdefault(row[icountry], len(countries)))
+                names.append(row[iname])
+                urls.append(row[iurl])
+
+        #countries are stored sorted and places grouped by country, in dump order
+        country_list = sorted(countries)
+        remap = numpy.zeros(len(country_list), dtype=numpy.uint32)
+        for i, country in enumerate(country_list):
+            remap[countries[country]] = i
+        ids = remap[numpy.array(country_ids, dtype=numpy.intp)]
+        order = numpy.argsort(ids, kind="mergesort")
+        starts = numpy.zeros(len(country_list) + 1, dtype=numpy.uint64)
+        starts[1:] = numpy.cumsum(numpy.bincount(ids, minlength=len(country_list)))
+
+        with open(filename, "wb") as fileh:
+            fileh.write(cls.HEADER.pack(cls.MAGIC, len(names), len(country_list)))
+            cls.__write_table(fileh, country_list)
+            cls.__write_array(fileh, starts, "<u8")
+            cls.__write_array(fileh, numpy.array(lon)[order], "<f8")
+            cls.__write_array(fileh, numpy.array(lat)[order], "<f8")
+            cls.__write_array(fileh, ids[order], "<u4")
+            cls.__write_table(fileh, [names[i] for i in order])
+            cls.__write_table(fileh, [urls[i] for i in order])
+
+        return len(names), skipped
+
+    @staticmethod
+    def __pad(fileh):
+        fileh.write("\0" * (_align(fileh.tell()) - fileh.tell()))
+
+    @classmethod
+    def __write_array(cls,fileh,values,dtype):
+        fileh.write(numpy.asarray(values).astype(dtype).tostring())
+        cls.__pad(fileh)
+
+    @classmethod
+    def __write_table(cls,fileh,strings):
+        """
+            Write a (offsets, heap) section
+        """
+        offsets = numpy.zeros(len(strings) + 1, dtype=numpy.uint64)
+        offsets[1:] = numpy.cumsum([len(s) for s in strings])
+        cls.__write_array(fileh, offsets, "<u8")
+        for s in strings:
+            fileh.write(s)
+        cls.__pad(fileh)
+
+
+def _align(pos):
+    return (pos + 7) & ~7
@@ -13,7 +13,11 @@ class cReport():
     __country_val = [];
     __live = False;
     __WKTashape = "";
+    __ashapes = [];
     __WKTchull = "";
+    __country_chulls = [];
+    __snap = None;
+    __weights = [];
     __query = "";
     __ofilename = "";
 
@@ -48,6 +52,10 @@ class cReport():
         report_list.append("Retrieved Points:\t"+str(self.__NPOINTS).ljust(20))
         report_list.append("Skipped Points:\t"+str(self.__NPOINTS - sum(self.__country_val)).ljust(20))
         report_list.append("FILE:\t"+str(self.__ofilename).ljust(20))
+        if self.__snap is not None:
+            report_list.append("Snap Tolerance:\t"+str(self.__snap).ljust(20))
+            report_list.append("Shaped Points:\t"+str(len(self.__weights)).ljust(20))
+            report_list.append("Max Places per Point:\t"+str(max(self.__weights) if len(self.__weights) else 0).ljust(20))
         report_list.append("")
         report_list.append("country".rjust(30)+"|".rjust(5)+"total_points".rjust(5))
 
@@ -56,14 +64,20 @@ class cReport():
 
 
         report_list.append(self.__print_banner("GEOMETRIES"))
-        report_list.append("---- Alpha Shape WKT ---")
-        report_list.append(self.__WKTashape)
-        report_list.append("Alpha:"+str(self.__alpha).ljust(20))
+        for alpha, wkt in self.__ashapes or [(self.__alpha, self.__WKTashape)]:
+            report_list.append("---- Alpha Shape WKT ---")
+            report_list.append(wkt)
+            report_list.append("Alpha:"+str(alpha).ljust(20))
         report_list.append("Optimal Alpha: "+str(self.__optalpha).ljust(20))
         report_list.append("")
         report_list.append("---- Convex Hull Shape WKT ---")
         report_list.append(self.__WKTchull)
         report_list.append("")
+        if self.__country_chulls:
+            report_list.append("---- Country Convex Hulls WKT ---")
+            for country, wkt in self.__country_chulls:
+                report_list.append(str(country)+";"+wkt)
+            report_list.append("")
 
         return "\n".join(report_list)
 
@@ -124,12 +138,42 @@ class cReport():
         """
         self.__WKTashape = wkt;
 
+    def add_wkt_ashape(self,alpha,wkt):
+        """
+            \brief Adds the WKT of the alpha shape for one of several alphas
+            \param alpha used alpha
+            \param wkt Alpha shape polygons
+        """
+        self.__ashapes.append((alpha, wkt));
+
+    def set_optimal_alpha(self,optalpha):
+        """
+            \brief Sets the report optimal alpha
+        """
+        self.__optalpha = optalpha;
+
     def set_wkt_chull(self,wkt):
         """
             \brief sets the WKT for the convex hull
         """
         self.__WKTchull = wkt;
 
+    def set_snap(self,tolerance,weights):
+        """
+            \brief Sets the points the shapes are made of, after collapsing close places
+            \param tolerance Grid cell size used to collapse them
+            \param weights Number of places of every shaped point
+        """
+        self.__snap = tolerance;
+        self.__weights = weights;
+
+    def set_wkt_country_chulls(self,hulls):
+        """
+            \brief sets the WKT for the convex hull of every country
+            \param hulls List of (country, wkt)
+        """
+        self.__country_chulls = hulls;
+
     def set_query(self,query):
         self.__query = query;
 
@@ -0,0 +1,177 @@
+from multiprocessing.pool import ThreadPool
+import Queue
+import os
+import struct
+import subprocess
+import sys
+import threading
+
+import numpy
+from shapely import wkb
+from shapely.geometry import MultiPolygon
+
+SERVER = os.path.join(os.path.dirname(os.path.realpath(__file__)), "alpha_shaper.py")
+
+#Every message is a uint32 payload length followed by the payload (little endian).
+#job:    uint32 points, uint32 alphas, float64 lon[points], lat[points], alphas[alphas]
+#result: uint8 status. 0: float64 optimal alpha, uint32 shapes, then per shape
+#        uint32 length and WKB. 1: utf-8 error message
+LENGTH = struct.Struct("<I")
+JOB = struct.Struct("<II")
+RESULT = struct.Struct("<dI")
+
+def read_exactly(fileh, size):
+    """
+        Read size bytes, or raise EOFError if the stream ends before
+    """
+    chunks = []
+    while size > 0:
+        chunk = fileh.read(size)
+        if not chunk:
+            raise EOFError("alpha shaper stream closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def read_message(fileh):
+    """
+        \return Payload of the next message, None at the end of the stream
+    """
+    header = fileh.read(LENGTH.size)
+    if not header:
+        return None
+    if len(header) < LENGTH.size:
+        header += read_exactly(fileh, LENGTH.size - len(header))
+    return read_exactly(fileh, LENGTH.unpack(header)[0])
+
+def write_message(fileh, payload):
+    fileh.write(LENGTH.pack(len(payload)))
+    fileh.write(payload)
+    fileh.flush()
+
+def encode_job(lon, lat, alphas):
+    lon = numpy.asarray(lon, dtype="<f8")
+    lat = numpy.asarray(lat, dtype="<f8")
+    alphas = numpy.asarray(alphas, dtype="<f8")
+    return JOB.pack(len(lon), len(alphas)) + lon.tobytes() + lat.tobytes() + alphas.tobytes()
+
+def decode_job(payload):
+    """
+        \return Tuple (lon, lat, alphas) of numpy arrays
+    """
+    npoints, nalphas = JOB.unpack_from(payload, 0)
+    values = numpy.frombuffer(payload, dtype="<f8", count=2 * npoints + nalphas, offset=JOB.size)
+    return values[:npoints], values[npoints:2 * npoints], values[2 * npoints:]
+
+def encode_result(optimal, shapes):
+    parts = [b"\x00", RESULT.pack(optimal, len(shapes))]
+    for shape in shapes:
+        data = shape.wkb
+        parts.append(LENGTH.pack(len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+def encode_error(message):
+    return b"\x01" + message.encode("utf-8")
+
+def decode_result(payload):
+    """
+        \return Tuple (optimal alpha, list of shapely MultiPolygon)
+    """
+    if payload[:1] != b"\x00":
+        raise RuntimeError("alpha shaper failed: " + payload[1:].decode("utf-8"))
+
+    optimal, nshapes = RESULT.unpack_from(payload, 1)
+    pos = 1 + RESULT.size
+    shapes = []
+    for i in range(nshapes):
+        size = LENGTH.unpack_from(payload, pos)[0]
+        pos += LENGTH.size
+        shape = wkb.loads(payload[pos:pos + size])
+        pos += size
+        shapes.append(shape if not shape.is_empty else MultiPolygon())
+    return optimal, shapes
+
+class cShaperPool():
+    """
+        \brief Pool of long lived alpha shaper processes
+        \details Each worker is an alpha_shaper.py --server process, started once and fed
+        with jobs over its stdin, so thousands of small shapes do not pay a process
+        start, the imports and a temporary file each. Jobs and results are binary
+        messages (see the format above). Jobs given to map() run on every worker at
+        the same time.
+    """
+
+    def __init__(self,workers=4,command=None):
+        """
+            Class constructor. Starts the worker processes
+            \param workers Number of processes
+            \param command Command line of a worker. Defaults to this python running
+            alpha_shaper.py --server
+        """
+        self.command = command or [sys.executable, SERVER, "--server"]
+        self.workers = workers
+        self.idle = Queue.Queue()
+        self.lock = threading.Lock()
+        self.processes = []
+        for i in range(workers):
+            self.idle.put(self.__start())
+        self.threads = ThreadPool(workers)
+
+    def __start(self):
+        process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        with self.lock:
+            self.processes.append(process)
+        return process
+
+    def __replace(self,process):
+        """
+            Start a new worker instead of a broken one
+        """
+        with self.lock:
+            self.processes.remove(process)
+        try:
+            process.kill()
+        except OSError:
+            pass
+        process.wait()
+        return self.__start()
+
+    def shape(self,lon,lat,alphas):
+        """
+            \brief Alpha shapes of a point set for several alphas, on an idle worker
+            \return Tuple (optimal alpha, list of shapely MultiPolygon in alphas order)
+        """
+        process = self.idle.get()
+        try:
+            write_message(process.stdin, encode_job(lon, lat, alphas))
+            payload = read_message(process.stdout)
+            if payload is None:
+                raise EOFError("alpha shaper process exited")
+        except (IOError, EOFError):
+            process = self.__replace(process)
+            raise
+        finally:
+            self.idle.put(process)
+
+        return decode_result(payload)
+
+    def map(self,jobs):
+        """
+            \brief Run jobs on all the workers
+            \param jobs Iterable of (lon, lat, alphas)
+            \return Iterator of shape() results, in jobs order
+        """
+        return self.threads.imap(lambda job: self.shape(*job), jobs)
+
+    def close(self):
+        """
+            \brief Stop the workers. They exit when their stdin is closed
+        """
+        self.threads.close()
+        with self.lock:
+            processes = list(self.processes)
+            self.processes = []
+        for process in processes:
+            process.stdin.close()
+            process.wait()
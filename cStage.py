@@ -0,0 +1,99 @@
+import threading
+import time
+
+class cStage(threading.Thread):
+    """
+        \brief A pipeline stage running in its own thread
+        \details Stages are chained with bounded queues: each one takes items from its input
+        queue, processes them and puts the results in its output queue, so every stage works
+        on a different item at the same time. A stage without input queue is the producer:
+        its work function is a generator whose items feed the pipeline.
+
+        None travels down the pipeline as end marker. An exception raised by a stage is
+        forwarded down as an item and the stage stops, the consumer of the last queue
+        decides what to do with it.
+
+        Items are dictionaries. Their "rows" and "bytes" keys, if present, are added to the
+        stage statistics.
+    """
+
+    def __init__(self,name,work,inqueue,outqueue):
+        """
+            Class constructor
+            \param name Stage name for the statistics
+            \param work Function item -> item, or generator function for the producer
+            \param inqueue Queue.Queue to read from, None for the producer
+            \param outqueue Queue.Queue to write to
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.name = name
+        self.work = work
+        self.inqueue = inqueue
+        self.outqueue = outqueue
+
+        self.items = 0
+        self.rows = 0
+        self.bytes = 0
+        self.busy = 0.0
+        self.started = None
+        self.finished = None
+
+    def __account(self,item,elapsed):
+        self.busy += elapsed
+        self.items += 1
+        self.rows += item.get("rows", 0)
+        self.bytes += item.get("bytes", 0)
+
+    def run(self):
+        """
+            \brief Start the thread
+        """
+        self.started = time.time()
+        try:
+            if self.inqueue is None:
+                self.__produce()
+            else:
+                self.__consume()
+        except Exception as inst:
+            self.outqueue.put(inst)
+        self.finished = time.time()
+        self.outqueue.put(None)
+
+    def __produce(self):
+        items = self.work()
+        while True:
+            start = time.time()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            self.__account(item, time.time() - start)
+            self.outqueue.put(item)
+
+    def __consume(self):
+        while True:
+            item = self.inqueue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                self.outqueue.put(item)
+                return
+
+            start = time.time()
+            result = self.work(item)
+            self.__account(result, time.time() - start)
+            self.outqueue.put(result)
+
+    def stats(self):
+        """
+            \brief One line summary of the stage throughput
+            \details Rows per second are measured on the time the stage was busy, the rest
+            of the time it was waiting for the other stages. The bottleneck is the stage
+            busy most of the time.
+        """
+        elapsed = (self.finished or time.time()) - (self.started or time.time())
+        rate = self.rows / self.busy if self.busy > 0 else 0
+        return "%s %s pages %s rows %.1f MB busy %.1fs of %.1fs %.0f rows/s" % (
+                str(self.name).ljust(6), str(self.items).rjust(6), str(self.rows).rjust(9),
+                self.bytes / 1048576.0, self.busy, elapsed, rate)
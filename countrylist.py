@@ -19,6 +19,8 @@ import cSpinner
 import cPlace
 import cReport
 import geom_functions as GEOM
+import shard_functions as SHARD
+from cPointStore import cPointStore
 
 
 # ###########################
@@ -31,6 +33,8 @@ parser = argparse.ArgumentParser(description='print a country list from a downlo
 
 parser.add_argument('--pointFile', default=None, dest='points',help='input file with points to alpha shape.')
 parser.add_argument('--nospinner', default=False, dest='nospinner',help='Deactivate live feedback via shell. For batch operations', action="store_true")
+parser.add_argument('--workers', type=int, default=None, dest='workers',help='Parsing processes [default: one per core]')
+parser.add_argument('--pointStore', default=None, dest='store',help='Point store built with point_store.py, read instead of pointFile')
 
 
 args = parser.parse_args()
@@ -61,44 +65,54 @@ def finish_program():
     S.stop()
     sys.exit(0)
 
-def read_countries_from_csv(filename):
+def count_countries(filename, start, end, header):
     """
-        Reads a CSV points file
-        "name;WKT;Country;Abstract"
-
-	We read this information apart because reading the whole
-	file can destroy our memory
+        Counts the points of every country in a shard of the file (see @ref shard_functions)
+        \return Tuple (dict country -> points, failed lines)
     """
-    data = {}
-    total = 0
+    icountry = header.index("country")
+    counts = {}
     failed = 0
+    for row in SHARD.shard_rows(filename, start, end):
+        #skip incorrectly parsed points
+        if len(row) <= icountry or "http://dbpedia.org/resource/" not in row[icountry]:
+            failed+=1
+            continue
+        counts[row[icountry]] = counts.get(row[icountry], 0) + 1
 
-    totalL = sum(1 for line in open(filename))
-    with open(filename, 'rb') as csvfile:
-        preader = csv.DictReader(csvfile, delimiter=';', quotechar='"')
-        for row in preader:
-            S.set_msg("Reading Countries: %s/%s. FAILED: %s"%(total,totalL,failed))
-            total+=1
+    return counts, failed
 
-            #skip incorrectly parsed points
-            if "http://dbpedia.org/resource/" not in row["country"]:
-                failed+=1
-                continue
+def read_countries_from_csv(filename, workers=None):
+    """
+        Reads a CSV points file
+        "name;country;URL;x;y;WKT"
 
-            if row["country"] not in data:
-                #country = re.sub("http://dbpedia.org/resource/","", row["country"])
-                #country = re.sub("http://dbpedia.org/resource/","", country)
-                data[row["country"]] = 1
-                #data.append(country)
-            else:
-                data[row["country"]] += 1
+        The file is parsed in shards by a pool of workers processes and their counts
+        are added up.
+        \return sorted list of the countries with more than 3 points
+    """
+    S.set_msg("Reading Countries")
+    data = {}
+    failed = 0
+    for counts, shard_failed in SHARD.map_shards(filename, count_countries, (SHARD.read_header(filename),), workers):
+        failed += shard_failed
+        for country, val in counts.iteritems():
+            data[country] = data.get(country, 0) + val
 
-    rdata = []
-    for key,val in data.iteritems():
-        if val > 3:
-            rdata.append(key)
+    S.set_msg("Reading Countries: %s. FAILED: %s"%(len(data),failed))
+    return sorted(key for key, val in data.iteritems() if val > 3)
 
-    return rdata
+def read_countries_from_store(filename):
+    """
+        Reads the countries of a point store built with point_store.py
+        \details The store only keeps places with valid coordinates.
+        \return sorted list of the countries with more than 3 points
+    """
+    store = cPointStore(filename)
+    try:
+        return [country for country, val in zip(store.countries(), store.counts()) if val > 3]
+    finally:
+        store.close()
 
 
 # ###########################
@@ -132,7 +146,10 @@ try:
 
     # First get the countries
     S.set_msg("Generating country list")
-    countries  = read_countries_from_csv(args.points)
+    if args.store:
+        countries = read_countries_from_store(args.store)
+    else:
+        countries  = read_countries_from_csv(args.points, args.workers)
     for country in countries:
         print country
     sys.exit(1)
@@ -1,30 +1,236 @@
-from shapely.geometry import MultiPoint
+from shapely.geometry import MultiPoint, MultiPolygon, Polygon
+import io
 import os
 import subprocess
 
-def convex_hull(latlon_list):
+import numpy
+
+from cAlphaShape import cAlphaShape
+from cShaperPool import LENGTH, encode_job, encode_result, read_message, write_message, decode_result
+
+CGAL_SHAPER = os.path.join(os.path.dirname(os.path.realpath(__file__)), "alpha_shape/alpha_shaper")
+
+def convex_hull(lon,lat):
+    """
+       Generates the convex hull of a set of points, see @ref convex_hulls
+       \param lon Sequence (or numpy array) of longitudes
+       \param lat Sequence (or numpy array) of latitudes
+       \return WKT of the hull
+    """
+    hulls = convex_hulls(lon, lat, numpy.zeros(len(lon), dtype=numpy.int8))
+    if not hulls:
+        return MultiPoint().wkt
+    return hulls[0].wkt
+
+def convex_hulls(lon,lat,keys):
+    """
+        Convex hull of every group of points, in one pass over numpy arrays
+        \details The points are grouped by key with one sort. Per group, the points
+        strictly inside the octagon of its extreme points (min and max of x, y, x+y and
+        x-y) cannot be on the hull and are dropped with array operations
+        (Akl-Toussaint). The few points left are sorted once and each group is closed
+        with a monotone chain. The hulls are written like the shapely (GEOS) ones:
+        clockwise from the lowest point. Groups without area (one point, collinear
+        points) are handed to GEOS, so their Point or LineString is the shapely one.
+        Nearly collinear float vertices may still be kept or dropped unlike GEOS.
+        \param keys Sequence with the group of every point, e.g. the country
+        \return dict key -> shapely Polygon, LineString (collinear group) or Point
+    """
+    x = numpy.asarray(lon, dtype=numpy.float64)
+    y = numpy.asarray(lat, dtype=numpy.float64)
+    if len(x) == 0:
+        return {}
+
+    names, group = numpy.unique(numpy.asarray(keys), return_inverse=True)
+    order = numpy.argsort(group, kind='mergesort')
+    x, y, group = x[order], y[order], group[order]
+    starts = numpy.flatnonzero(numpy.r_[True, group[1:] != group[:-1]])
+
+    #octagon corners, counterclockwise from the west
+    corners = [_group_extreme(v, group, starts, largest)
+               for v, largest in ((x, False), (x + y, False), (y, False), (x - y, True),
+                                  (x, True), (x + y, True), (y, True), (x - y, False))]
+
+    inside = numpy.ones(len(x), dtype=bool)
+    for k in range(8):
+        a = corners[k][group]
+        b = corners[(k + 1) % 8][group]
+        ex = x[b] - x[a]
+        ey = y[b] - y[a]
+        cross = ex * (y - y[a]) - ey * (x - x[a])
+        #a corner repeated (zero length side) does not bound anything
+        inside &= (cross > 0) | ((ex == 0) & (ey == 0))
+    for corner in corners:
+        inside[corner] = False
+
+    keep = numpy.flatnonzero(~inside)
+    keep = keep[numpy.lexsort((y[keep], x[keep], group[keep]))]
+    bounds = numpy.flatnonzero(numpy.r_[True, group[keep][1:] != group[keep][:-1], True])
+
+    hulls = {}
+    points = numpy.column_stack((x[keep], y[keep])).tolist()
+    ends = numpy.r_[starts[1:], len(x)]
+    for i, (name, begin, end) in enumerate(zip(names.tolist(), bounds[:-1], bounds[1:])):
+        hull = _monotone_chain(points[begin:end])
+        if len(hull) < 3:
+            #GEOS picks the ends and direction of degenerate hulls
+            hulls[name] = MultiPoint(numpy.column_stack((x[starts[i]:ends[i]], y[starts[i]:ends[i]])).tolist()).convex_hull
+        else:
+            hulls[name] = _hull_geometry(hull)
+    return hulls
+
+def _group_extreme(values,group,starts,largest):
+    """
+        Index of the smallest (or largest) value of every group, groups contiguous
+    """
+    best = (numpy.maximum if largest else numpy.minimum).reduceat(values, starts)
+    hits = numpy.flatnonzero(values == best[group])
+    return hits[numpy.searchsorted(group[hits], numpy.arange(len(starts)))]
+
+def _monotone_chain(points):
+    """
+        Hull vertices of points sorted by x then y, counterclockwise, collinear ones dropped
+    """
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    if len(points) < 2:
+        return points
+    lower = []
+    for p in points:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    upper = []
+    for p in reversed(points):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return lower[:-1] + upper[:-1]
+
+def _hull_geometry(hull):
+    """
+        shapely Polygon of monotone chain hull vertices (at least 3), in GEOS order
     """
-       Generates the convex hull of a latlon list of tuples
-       [(lat0,lon0),(lat1,lon1),...(latN,lonN)]
+    hull = hull[::-1]
+    first = min(range(len(hull)), key=lambda i: (hull[i][1], hull[i][0]))
+    hull = hull[first:] + hull[:first]
+    return Polygon(hull + hull[:1])
+
+def snap_points(lon,lat,tolerance=0):
+    """
+        Collapse points closer than a grid cell into one weighted point
+        \details Every point goes to the cell floor(coordinate / tolerance) of a
+        square grid, and the points of a cell are replaced by their mean. With a
+        tolerance of 0 only points with the same coordinates are collapsed, which does
+        not change the alpha shapes.
+        \param tolerance Cell size, in the units of the coordinates (degrees)
+        \return Tuple (lon array, lat array, weights: number of points collapsed in each)
+    """
+    points = numpy.column_stack((numpy.asarray(lon, dtype=numpy.float64),
+                                 numpy.asarray(lat, dtype=numpy.float64)))
+    if len(points) == 0:
+        return points[:, 0], points[:, 1], numpy.zeros(0, dtype=numpy.intp)
+
+    cells = numpy.floor(points / tolerance) if tolerance > 0 else points
+    #one complex number per cell, so the cells are found with a 1-D unique
+    keys = numpy.ascontiguousarray(cells).view(numpy.complex128).ravel()
+    keys, inverse, weights = numpy.unique(keys, return_inverse=True, return_counts=True)
+    if tolerance <= 0:
+        return keys.real.copy(), keys.imag.copy(), weights
+
+    return (numpy.bincount(inverse, points[:, 0]) / weights,
+            numpy.bincount(inverse, points[:, 1]) / weights, weights)
+
+def alpha_shape(lon,lat,alpha):
+    """
+        In process alpha shape of a set of points, see @ref cAlphaShape
+        \param lon Sequence of longitudes
+        \param lat Sequence of latitudes
+        \param alpha Squared radius, as in alpha_shaper -a
+        \return Tuple (optimal alpha, shapely MultiPolygon)
+    """
+    shaper = cAlphaShape(lon, lat)
+    return (shaper.optimal_alpha(), shaper.shape(alpha))
+
+def alpha_shapes(lon,lat,alphas):
+    """
+        In process alpha shapes of a set of points for a list of alphas.
+        \details The triangulation is built once for all of them, see @ref cAlphaShape
+        \param alphas Sequence of squared radius
+        \return Tuple (optimal alpha, list of shapely MultiPolygon in alphas order)
+    """
+    shaper = cAlphaShape(lon, lat)
+    return (shaper.optimal_alpha(), [shape for alpha, shape in shaper.sweep(alphas)])
+
+def simplify_shape(geometry,tolerance):
+    """
+        Simplify the rings of a shape keeping it valid
+        \details GEOS TopologyPreservingSimplifier (Douglas-Peucker that keeps every
+        polygon valid: its rings do not cross and its holes stay inside). It only does
+        so within a polygon, the touching polygons of an alpha shape may still end up
+        crossing each other. When the simplified shape is not valid, the polygons are
+        simplified one by one and a polygon is kept unsimplified when its simplified
+        version would make the shape invalid. No polygon disappears.
+        \param tolerance Largest distance of a removed vertex to the simplified ring,
+        in the units of the coordinates (degrees). 0 leaves the shape as it is
+        \return shapely MultiPolygon
+    """
+    if tolerance <= 0 or geometry.is_empty:
+        return geometry
+    simplified = geometry.simplify(tolerance, preserve_topology=True)
+    if simplified.geom_type == 'Polygon':
+        simplified = MultiPolygon([simplified])
+    if simplified.is_valid:
+        return simplified
+
+    polygons = list(geometry.geoms)
+    for i, polygon in enumerate(polygons):
+        candidate = polygon.simplify(tolerance, preserve_topology=True)
+        if candidate.is_valid and MultiPolygon(polygons[:i] + [candidate] + polygons[i + 1:]).is_valid:
+            polygons[i] = candidate
+    return MultiPolygon(polygons)
+
+def write_shapes_wkb(fileh,optimal,shapes):
+    """
+        Write alpha shapes to a binary file as WKB
+        \details One message of the alpha_shaper protocol (see cShaperPool.py): the
+        optimal alpha and one WKB MultiPolygon per alpha. Read it back with
+        read_shapes_wkb()
     """
-    return MultiPoint(latlon_list).convex_hull.wkt
+    write_message(fileh, encode_result(optimal, shapes))
 
-def alpha_shape(cgalfile,alpha):
+def read_shapes_wkb(fileh):
     """
-        External system execution of alpha_shaper to generate a WKT alpha shape file.
-        Expects a CGAL file with lon lat corrdinates and the first line an integer
-        of the total number of lines to read
+        \return Tuple (optimal alpha, list of shapely MultiPolygon) of write_shapes_wkb()
     """
-    expath = os.path.join(os.path.dirname(os.path.realpath(__file__)),"alpha_shape/alpha_shaper");
-    filpath = os.path.realpath(cgalfile.name);
-    
-    try:
-        wkt_polygons = subprocess.check_output([expath,"-i",filpath,"-a",str(alpha)])
-        opt_alpha = subprocess.check_output([expath,"-i",filpath,"--optimalalpha"])
-    except:
-        wkt_polygons = "Error Executing:"+str(expath)+" -i "+filpath+" -a "+str(alpha);
-        alpha = 0
-        opt_alpha = 0
+    return decode_result(read_message(fileh))
 
-    return (opt_alpha,wkt_polygons)
+def polygons_wkt(geometry):
+    """
+        WKT of the polygons of a geometry, one POLYGON per line like alpha_shaper writes them
+    """
+    if geometry.is_empty:
+        return ""
+    if geometry.geom_type == 'Polygon':
+        return geometry.wkt
+    return "\n".join(polygon.wkt for polygon in geometry.geoms)
+
+def alpha_shapes_cgal(lon,lat,alphas,kernel="epec"):
+    """
+        External system execution of alpha_shaper for a list of alphas.
+        \details The points go to alpha_shaper --binary as one packed job on its stdin
+        and the polygons come back as WKB (see cShaperPool.py), so there is no
+        temporary file and no text to format or parse.
+        \param kernel CGAL kernel of alpha_shaper: epec (exact constructions) or epick
+        \return Tuple (optimal alpha, list of shapely MultiPolygon in alphas order)
+    """
+    process = subprocess.Popen([CGAL_SHAPER, "--binary", "--kernel", kernel],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    job = encode_job(lon, lat, alphas)
+    out, err = process.communicate(LENGTH.pack(len(job)) + job)
 
+    payload = read_message(io.BytesIO(out))
+    if process.returncode != 0 or payload is None:
+        raise RuntimeError("Error Executing: %s --binary --kernel %s" % (CGAL_SHAPER, kernel))
+    return decode_result(payload)
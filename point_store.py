@@ -0,0 +1,55 @@
+"""
+ Build or query a memory-mapped columnar store of the places of a csv file
+ generated by alldbpediapoints.py
+ Vagueplaces Generator
+
+ The store can then be read by countrylist.py, batch_country_dataset_generator.py
+ and alpha_shaper.py with --pointStore, instead of parsing the dump again
+"""
+
+
+import argparse
+import time
+
+from cPointStore import cPointStore
+
+
+# ###########################
+#
+#  ARGUMENT PARSING
+#
+# ###########################
+
+parser = argparse.ArgumentParser(description='Build or query a columnar store of the dump places')
+
+parser.add_argument('--pointFile', default=None, dest='points',
+                    help='input file generated by alldbpediapoints.py. Builds the store')
+parser.add_argument('--pointStore', default='dbpedia.vps', dest='store',
+                    help='Store file [default dbpedia.vps]')
+parser.add_argument('--country', default=None, dest='country',
+                    help='Country URI. Prints its places as name;URL;x;y')
+
+args = parser.parse_args()
+
+# ###########################
+#
+#  START
+#
+# ###########################
+if args.points:
+    total, skipped = cPointStore.build(args.points, args.store)
+    print "%s places stored into %s. Skipped rows: %s" % (total, args.store, skipped)
+
+if args.country:
+    store = cPointStore(args.store)
+    start = time.time()
+    first, last = store.country_range(args.country)
+    lon, lat = store.coordinates(args.country)
+    elapsed = time.time() - start
+
+    print "name;URL;x;y"
+    for pid in range(first, last):
+        name, country, url, x, y = store.place(pid)
+        print "%s;%s;%r;%r" % (name, url, x, y)
+    print "%s places in %.1f ms" % (len(lon), elapsed * 1000)
+    store.close()
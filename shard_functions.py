@@ -0,0 +1,101 @@
+"""
+ Sharded reading of the dump CSV files
+ Vagueplaces Generator
+
+ The dumps written by alldbpediapoints.py have one record per line (abstracts are
+ written on a single line), so a dump can be cut in byte ranges at line starts and
+ every range parsed on its own, in a process pool.
+"""
+
+import csv
+import multiprocessing
+import os
+import signal
+
+
+def read_header(filename):
+    """
+        \return Column names of a dump, from its first line
+    """
+    with open(filename, 'rb') as fileh:
+        return next(csv.reader([fileh.readline()], delimiter=';', quotechar='"'))
+
+def shard_ranges(filename,shards):
+    """
+        Cut a dump, header excluded, in about equal byte ranges starting at line starts
+        \param shards Number of ranges wanted. Small files may get fewer
+        \return list of (start, end) byte offsets, in file order
+    """
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as fileh:
+        fileh.readline()
+        begin = fileh.tell()
+        bounds = [begin]
+        for k in range(1, shards):
+            target = begin + (size - begin) * k // shards
+            if target <= bounds[-1]:
+                continue
+            #the line going over target goes to the previous range
+            fileh.seek(target - 1)
+            fileh.readline()
+            bounds.append(fileh.tell())
+        bounds.append(size)
+
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+def shard_rows(filename,start,end):
+    """
+        \return csv reader of the lines starting in [start, end)
+    """
+    fileh = open(filename, 'rb')
+    fileh.seek(start)
+
+    def lines():
+        pos = start
+        try:
+            while pos < end:
+                line = fileh.readline()
+                if not line:
+                    break
+                pos += len(line)
+                yield line
+        finally:
+            fileh.close()
+
+    return csv.reader(lines(), delimiter=';', quotechar='"')
+
+def ignore_interrupt():
+    """
+        Pool initializer: workers ignore SIGINT, the parent handles it and stops the pool
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _run_shard(job):
+    function, filename, start, end, args = job
+    return function(filename, start, end, *args)
+
+def map_shards(filename,function,args=(),workers=None):
+    """
+        Run function(filename, start, end, *args) on every shard of a dump, in a
+        process pool
+        \details function has to be a module level function so the workers can find it
+        \param workers Number of processes (and shards). All the cores by default
+        \return list of the results, in file order
+    """
+    workers = workers or multiprocessing.cpu_count()
+    jobs = [(function, filename, start, end, args) for start, end in shard_ranges(filename, workers)]
+    if len(jobs) <= 1:
+        return [_run_shard(job) for job in jobs]
+
+    pool = multiprocessing.Pool(min(workers, len(jobs)), ignore_interrupt)
+    try:
+        #get() with a timeout keeps the main thread responsive to SIGINT
+        results = pool.map_async(_run_shard, jobs).get(0xFFFF)
+    except:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+    return results
@@ -0,0 +1,282 @@
+"""
+ SPARQL query helpers shared by the DBpedia extraction scripts
+ Vagueplaces Generator
+"""
+
+from SPARQLWrapper import CSV
+import StringIO
+import csv
+import json
+import random
+import socket
+
+PAGINATION_MODES = ["offset", "keyset", "tiles"]
+
+#(south, west, north, east) in degrees
+WORLD_TILE = (-90.0, -180.0, 90.0, 180.0)
+
+def sparql_literal(value):
+    """
+        Quote a python string as a SPARQL string literal
+    """
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def run_query(sparql, query, cache=None):
+    """
+        Run a query returning JSON, going through the response cache if given.
+        \param sparql SPARQLWrapper with JSON return format
+        \param query SPARQL query text
+        \param cache @ref cCache or None to always ask the endpoint
+        \return Decoded JSON results
+    """
+    if cache is None:
+        sparql.setQuery(query)
+        return sparql.query().convert()
+
+    key = cache.key(sparql.endpoint, query, "json")
+    data = cache.get(key)
+    if data is None:
+        sparql.setQuery(query)
+        data = sparql.query().response.read()
+        cache.put(key, data)
+
+    return json.loads(data)
+
+def stream_query(sparql, query, cache=None):
+    """
+        Run a query and yield its result rows while the response is still arriving.
+        \details The endpoint is asked for CSV results, parsed line by line, so memory
+        stays bounded by a row and not by the whole page. A response read to the end is
+        stored in the cache on the way, cached responses are streamed from disk.
+        \param sparql SPARQLWrapper. Its return format is set to CSV
+        \param query SPARQL query text
+        \param cache @ref cCache or None to always ask the endpoint
+        \return Generator of dictionaries variable -> unicode value ("" when unbound)
+    """
+    key = None
+    source = None
+    tee = None
+
+    if cache is not None:
+        key = cache.key(sparql.endpoint, query, "csv")
+        source = cache.open(key)
+
+    if source is None:
+        sparql.setReturnFormat(CSV)
+        sparql.setQuery(query)
+        source = sparql.query().response
+        if cache is not None:
+            tee = cache.create(key)
+
+    complete = False
+    try:
+        if tee is not None:
+            lines = tee_lines(source, tee)
+        else:
+            lines = source
+
+        for row in csv.DictReader(lines):
+            yield dict((var, (value or "").decode("utf-8")) for var, value in row.iteritems() if var is not None)
+        complete = True
+    finally:
+        source.close()
+        if tee is not None:
+            if complete:
+                cache.commit(key, tee)
+            else:
+                cache.discard(tee)
+
+def tee_lines(source, fileh):
+    """
+        Yield the lines of source, copying them to fileh
+    """
+    for line in source:
+        fileh.write(line)
+        yield line
+
+def bbox_filter(bbox):
+    """
+        FILTER keeping the places inside a tile.
+        \details Tiles are half open, [south, north) x [west, east), so a place on the
+        border of two tiles only belongs to one of them. Borders on the edge of the
+        world are closed.
+        \param bbox Tile (south, west, north, east)
+    """
+    south, west, north, east = bbox
+    north_op = "<=" if north >= WORLD_TILE[2] else "<"
+    east_op = "<=" if east >= WORLD_TILE[3] else "<"
+    return ("FILTER(?geolat >= %r && ?geolat %s %r && ?geolong >= %r && ?geolong %s %r)"
+            % (south, north_op, north, west, east_op, east))
+
+def split_tile(bbox):
+    """
+        Split a tile into its four quadrants
+        \param bbox Tile (south, west, north, east)
+        \return List of four tiles covering bbox
+    """
+    south, west, north, east = bbox
+    lat = (south + north) / 2.0
+    lon = (west + east) / 2.0
+    return [(south, west, lat, lon), (south, lon, lat, east),
+            (lat, west, north, lon), (lat, lon, north, east)]
+
+def tile_size(bbox):
+    """
+        Largest side of a tile, in degrees
+    """
+    south, west, north, east = bbox
+    return max(north - south, east - west)
+
+def dump_query(islive, limit, offset=0, last_seen=None, keyset=False, abstracts=False, bbox=None):
+    """
+        Build the query used to dump every DBpedia place with coordinates.
+        \param islive True to query DBpedia live (different wiki url predicate)
+        \param limit Maximum number of rows of the page
+        \param offset Rows to skip. Only used in offset pagination
+        \param last_seen Last ?place URI of the previous page. Only used in keyset pagination
+        \param keyset Use keyset pagination (ORDER BY ?place, FILTER > last_seen) instead of OFFSET
+        \param abstracts Also retrieve the english ?abstract of each place (empty if missing)
+        \param bbox Only the places inside this tile (south, west, north, east). The
+        country becomes optional so places without one are dumped too
+        \return query string
+    """
+    variables = "?title,?geolat,?geolong, ?country, ?wikiurl"
+    if keyset:
+        variables = "?place, " + variables
+    if abstracts:
+        variables = variables + ", ?abstract"
+
+    if islive:
+        wikiurl = "?place dbo:wikiPageRevisionLink ?wikiurl ."
+    else:
+        wikiurl = "?place prov:wasDerivedFrom ?wikiurl ."
+
+    country = """
+              ?place dbo:country ?country ."""
+    if bbox is not None:
+        country = """
+              OPTIONAL { ?place dbo:country ?country . }"""
+
+    extra = ""
+    if bbox is not None:
+        extra += """
+              """ + bbox_filter(bbox)
+    if abstracts:
+        extra += """
+              OPTIONAL { ?place dbo:abstract ?abstract . FILTER(langMatches(lang(?abstract), "en")) }"""
+    if keyset and last_seen is not None:
+        extra += """
+              FILTER(STR(?place) > """ + sparql_literal(last_seen) + """)"""
+
+    if keyset:
+        paging = """
+            ORDER BY ?place
+            LIMIT """ + str(limit)
+    else:
+        paging = """
+            OFFSET """ + str(offset) + """
+            LIMIT """ + str(limit)
+
+    return """
+            SELECT """ + variables + """
+            WHERE{
+              ?place rdf:type dbo:Place .
+              ?place foaf:name ?title .
+              ?place geo:lat ?geolat .
+              ?place geo:long ?geolong .
+              """ + wikiurl + country + extra + """
+            }""" + paging + """
+            """
+
+def keyset_rows(rows, limit, page):
+    """
+        Stream the rows of a keyset page so the next one can resume with STR(?place) > last_seen.
+        \details A place may have several rows (titles, countries) and a full page
+        can end in the middle of them. The rows of the place being read are held back
+        until the next place starts. If the page turns out to be full they are dropped
+        and fetched again, complete, with the next page.
+        \param rows Rows of the page, ordered by ?place
+        \param limit The LIMIT used in the query
+        \param page Dictionary filled, once the rows are consumed, with "rows" (rows
+        received) and "last_seen" (place URI to resume after, None if the page is empty)
+    """
+    count = 0
+    last_seen = None
+    pending = []
+
+    for row in rows:
+        count += 1
+        if pending and row["place"] != pending[0]["place"]:
+            for held in pending:
+                yield held
+            last_seen = pending[0]["place"]
+            pending = []
+        pending.append(row)
+
+    #A single place filling the whole page is kept. Nothing better can be done
+    #than moving on, its remaining rows are lost.
+    if pending and (count < limit or last_seen is None):
+        for held in pending:
+            yield held
+        last_seen = pending[0]["place"]
+
+    page["rows"] = count
+    page["last_seen"] = last_seen
+
+def read_page(body):
+    """
+        Split a raw CSV page of the dump in rows, parsed once for page_cursor() and
+        for the output
+        \return Tuple (column names or None for an empty response, list of rows)
+    """
+    reader = csv.reader(StringIO.StringIO(body))
+    return next(reader, None), list(reader)
+
+def page_cursor(header, rows, limit, keyset):
+    """
+        Find, in a page of the dump, the rows to keep and where the next page starts.
+        \details Same rules as keyset_rows(), run on the whole page at once so the next
+        page can be requested before this one is decoded.
+        \param header Column names of the page, see read_page()
+        \param rows Rows of the page
+        \param limit The LIMIT used in the query
+        \param keyset True if the page comes from keyset pagination
+        \return Tuple (rows received, rows to keep, last_seen place URI or None)
+    """
+    received = len(rows)
+    if header is None or received == 0:
+        return 0, 0, None
+    if not keyset:
+        return received, received, None
+
+    column = header.index("place")
+    last = rows[-1][column]
+    keep = received
+    if received >= limit:
+        while keep > 0 and rows[keep - 1][column] == last:
+            keep -= 1
+        if keep == 0:
+            #A single place filling the whole page is kept. Nothing better can be
+            #done than moving on, its remaining rows are lost.
+            keep = received
+
+    return received, keep, rows[keep - 1][column].decode("utf-8")
+
+def is_timeout(exception):
+    """
+        Guess if a failed query was a timeout, either on our socket or inside
+        the endpoint (Virtuoso answers "Transaction timed out" with an error 500)
+    """
+    if isinstance(exception, socket.timeout):
+        return True
+    text = str(exception).lower()
+    return "timed out" in text or "timeout" in text
+
+def backoff_delay(attempt, base=5, cap=600):
+    """
+        Seconds to wait before a retry. Exponential backoff with full jitter.
+        \param attempt Number of the retry (1 for the first one)
+        \param base Seconds of the first backoff step
+        \param cap Maximum seconds to wait
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
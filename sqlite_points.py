@@ -0,0 +1,35 @@
+"""
+ Build an SQLite database from a csv file generated by alldbpediapoints.py --abstracts
+ Vagueplaces Generator
+
+ The database can then be queried offline with vagueplaces.py --source sqlite
+"""
+
+
+import argparse
+
+from cPointSource import cSqlitePointSource
+
+
+# ###########################
+#
+#  ARGUMENT PARSING
+#
+# ###########################
+
+parser = argparse.ArgumentParser(description='Import a downloaded CSV into an SQLite database')
+
+parser.add_argument('--pointFile', default=None, dest='points', required=True,
+                    help='input file generated by alldbpediapoints.py --abstracts')
+parser.add_argument('--db', default='dbpedia.sqlite', dest='db',
+                    help='SQLite database to create. Replaced if it exists [default dbpedia.sqlite]')
+
+args = parser.parse_args()
+
+# ###########################
+#
+#  START
+#
+# ###########################
+total = cSqlitePointSource.build(args.points, args.db)
+print "%s rows imported into %s" % (total, args.db)
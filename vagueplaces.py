@@ -8,18 +8,22 @@
 
 """
 
-from SPARQLWrapper import SPARQLWrapper, SPARQLExceptions, JSON
 import argparse
+import functools
 import signal
 import os
 import sys
-import tempfile
 import xml, warnings
 
+import numpy
+
 import cSpinner
 import cPlace
 import cReport
 import geom_functions as GEOM
+from cAbstractIndex import cAbstractIndex
+from cCache import cCache
+from cPointSource import SOURCES, cSparqlPointSource, cCsvPointSource, cSqlitePointSource, cIndexPointSource
 
 
 # ###########################
@@ -33,7 +37,26 @@ parser = argparse.ArgumentParser(description='Retrieve dbpedia points and genera
 parser.add_argument('--query', action='store', dest='stringval', default=None,nargs='+',
                     help='List of keywords to filter from the Abstract results. Interpreted as Logical disjunction')
 
-parser.add_argument('--alpha',type=float,default=0.1,dest='floatval')
+parser.add_argument('--alpha',type=float,default=[0.1],dest='floatval',nargs='+',
+                    help='Alpha values. Several alphas are shaped on the same triangulation, one alpha shape each in the report [default 0.1]')
+
+parser.add_argument('--engine', choices=['python', 'cgal'], default='python', dest='engine',
+                    help='Alpha shape implementation: in process (numpy/scipy) or the external alpha_shape/alpha_shaper binary [default python]')
+
+parser.add_argument('--kernel', choices=['epec', 'epick'], default='epec', dest='kernel',
+                    help='CGAL kernel of --engine cgal: exact constructions, or inexact constructions (faster) [default epec]')
+
+parser.add_argument('--snap', type=float, default=0, dest='snap',
+                    help='Collapse places closer than this grid cell size (degrees) into one point before shaping. 0 collapses only identical coordinates [default 0]')
+
+parser.add_argument('--simplify', type=float, default=0, dest='simplify',
+                    help='Simplify the alpha shapes with this tolerance (degrees), keeping holes inside and rings apart. 0 keeps every vertex [default 0]')
+
+parser.add_argument('--wkbFile', default=None, dest='wkbFile',
+                    help='Also write the alpha shapes as WKB to this binary file, see geom_functions.read_shapes_wkb()')
+
+parser.add_argument('--countryHulls', action='store_true', default=False, dest='country_hulls',
+                    help='Add the convex hull of the places of every country to the report')
 
 parser.add_argument('--reportFile', default=None, dest='reportFile',help='Store report to a file instead that StdOut')
 
@@ -44,12 +67,55 @@ parser.add_argument('--live', action='store_true',default=False,
                     dest='live_bool',
                     help='Use Dbpedia live SPARQL endpoint instead of last released version')
 
+parser.add_argument('--source', choices=SOURCES, default='sparql', dest='source',
+                    help='Where places come from: the DBpedia SPARQL endpoint, or a local dump (csv from alldbpediapoints.py --abstracts, sqlite from sqlite_points.py, index from abstract_index.py) [default sparql]')
+
+parser.add_argument('--pointFile', default=None, dest='points',
+                    help='Local dump used by the csv and sqlite sources')
+
+parser.add_argument('--countries', default=None, dest='countries',
+                    help='File with the country URIs to query, one per line (as printed by countrylist.py). Local sources query every country by default')
+
+parser.add_argument('--workers', type=int, default=4, dest='workers',
+                    help='Number of countries fetched concurrently. Keep it low on public endpoints [default 4]')
+
+parser.add_argument('--batch-size', type=int, default=0, dest='batch_size',
+                    help='Countries bound in a single query with VALUES. Batches hitting the result limit are split. 0 for one query per country [default 0]')
+
+parser.add_argument('--cache-dir', default=os.path.join(os.path.expanduser("~"), ".cache", "vagueplaces"),
+                    dest='cache_dir',
+                    help='Directory where SPARQL responses are cached [default ~/.cache/vagueplaces]')
+
+parser.add_argument('--no-cache', action='store_true', default=False,
+                    dest='no_cache',
+                    help='Always query the endpoint, do not read nor store cached responses')
+
+parser.add_argument('--refresh', action='store_true', default=False,
+                    dest='refresh',
+                    help='Query the endpoint again and replace the cached responses')
+
+parser.add_argument('--cache-ttl', type=float, default=7 * 24, dest='cache_ttl',
+                    help='Hours a cached response stays valid [default 168]')
+
+parser.add_argument('--cache-size', type=float, default=1024, dest='cache_size',
+                    help='Maximum cache size in MB. Least recently used responses are evicted [default 1024]')
+
 parser.add_argument('--verbose', action='store_true', default=False,
                     dest='debug_bool',
                     help='Verbose output')
 
 arguments  = parser.parse_args()
 
+if arguments.source != 'sparql' and arguments.points is None:
+    parser.error("--source %s needs --pointFile" % arguments.source)
+
+if arguments.source == 'index':
+    try:
+        for keyword in arguments.stringval or []:
+            cAbstractIndex.check_keyword(str(keyword))
+    except ValueError as inst:
+        parser.error(str(inst))
+
 
 # ###########################
 #
@@ -58,24 +124,50 @@ arguments  = parser.parse_args()
 # ###########################
 query_list = arguments.stringval
 OF = arguments.CSV_POINT_OUTPUT
-alpha = arguments.floatval
+alphas = arguments.floatval
 isdebug = arguments.debug_bool
 islive = arguments.live_bool
+workers = max(1, arguments.workers)
+batch_size = arguments.batch_size
 RESULTS_QUERY = 500000
 PLACES = []
 
 #sparql endpoint
 if islive:
-    #sparql = SPARQLWrapper("http://live.dbpedia.org/sparql")
-    sparql = SPARQLWrapper("http://dbpedia-live.openlinksw.com/sparql")
+    #ENDPOINT = "http://live.dbpedia.org/sparql"
+    ENDPOINT = "http://dbpedia-live.openlinksw.com/sparql"
+else:
+    ENDPOINT = "http://dbpedia.org/sparql"
+
+#response cache
+if arguments.no_cache:
+    CACHE = None
 else:
-    sparql = SPARQLWrapper("http://dbpedia.org/sparql")
+    CACHE = cCache(arguments.cache_dir,
+                   ttl = arguments.cache_ttl * 3600,
+                   max_bytes = int(arguments.cache_size * 1024 * 1024),
+                   refresh = arguments.refresh)
 
 #Spinner
 S = cSpinner.cSpinner()
 S.set_msg("loading")
 S.start()
 
+#point source
+if arguments.source == 'csv':
+    SOURCE = cCsvPointSource(arguments.points)
+elif arguments.source == 'sqlite':
+    SOURCE = cSqlitePointSource(arguments.points)
+elif arguments.source == 'index':
+    SOURCE = cIndexPointSource(arguments.points)
+else:
+    SOURCE = cSparqlPointSource(ENDPOINT,
+                                cache = CACHE,
+                                workers = workers,
+                                batch_size = batch_size,
+                                results_query = RESULTS_QUERY,
+                                spinner = S)
+
 #report
 REPORT = cReport.cReport();
 REPORT.set_query(str(query_list));
@@ -86,67 +178,16 @@ REPORT.set_points_filename(os.path.realpath(str(OF.name)));
 #  FUNCTIONS
 #
 # ###########################
-def european_countries():
+def selected_countries():
     """
-        Retrieve an europe country list from DBpedia with URIs.
-        @return List with country URIS
+        Countries to query: the ones listed in --countries or all the source countries
+        \return List with country URIS
     """
-    sparql.setReturnFormat(JSON)
+    if arguments.countries:
+        with open(arguments.countries) as fileh:
+            return [line.strip() for line in fileh if line.strip()]
 
-    sparql.setQuery("""
-                    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-                    PREFIX yago: <http://dbpedia.org/class/yago/>
-                    PREFIX dbo: <http://dbpedia.org/ontology/>
-
-                    SELECT DISTINCT ?place WHERE {
-                        ?place rdf:type yago:EuropeanCountries .
-                        ?place rdf:type dbo:Country
-                    }
-                    """
-    )
-
-    results = sparql.query().convert()
-
-    if not isinstance(results, dict):
-        warnings.warn("Parsing Failure. Not a dictionary")
-        finish_program()
-
-    return results["results"]["bindings"]
-
-def get_points(country_uri,query_list,offset,limit):
-    """
-        Retrieve a list of points from DBpedia matching the input.
-        \param country_uri country to query
-        \param query_list substring to check in the Abstract
-        \param offset Offset to start retrieving
-        \param limit Limit of lines to retrieve
-        \return List with points with title,geolat,geolong
-    """
-    regex_list = []
-    for q in query_list:
-        regex_list.append("""regex(?abstract,\" """+str(q)+"""\","i") """)
-
-    query = "||".join(regex_list)
-
-    querystr = """
-        SELECT DISTINCT ?title,?geolat,?geolong
-        WHERE{
-          ?place rdf:type dbo:Place .
-          ?place dbo:country <""" + country_uri + """> .
-          ?place foaf:name ?title .
-          ?place geo:lat ?geolat .
-          ?place geo:long ?geolong .
-          ?place dbo:abstract ?abstract .
-          FILTER ("""+ query +""")
-        }
-        OFFSET """ + str(offset) + """
-        LIMIT """ + str(limit)+ """
-        """
-
-    sparql.setQuery(querystr)
-
-    country_results = sparql.query().convert()
-    return country_results["results"]["bindings"]
+    return SOURCE.countries()
 
 def gen_heatmap():
     """
@@ -154,40 +195,51 @@ def gen_heatmap():
     """
     pass
 
-def gen_convex_hull():
+def place_coordinates():
     """
-        Generate the convex hull for the report
+        Coordinates of the places as numpy arrays, parsed by numpy from the strings
+        \return Tuple (lon array, lat array)
     """
-    plist = []
+    lon = numpy.array([p.lon for p in PLACES], dtype=numpy.float64)
+    lat = numpy.array([p.lat for p in PLACES], dtype=numpy.float64)
+    return lon, lat
 
-    for p in PLACES:
-        plist.append((float(p.lon),float(p.lat)))
+def gen_convex_hull(country_hulls=False):
+    """
+        Generate the convex hull for the report
+        \param country_hulls Also the hull of every country, in the same grouped pass
+    """
+    lon, lat = place_coordinates()
+    REPORT.set_wkt_chull(GEOM.convex_hull(lon,lat))
 
-    REPORT.set_wkt_chull(GEOM.convex_hull(plist))
+    if country_hulls:
+        hulls = GEOM.convex_hulls(lon,lat,[p.country for p in PLACES])
+        REPORT.set_wkt_country_chulls([(country, hull.wkt) for country, hull in sorted(hulls.items())])
 
-def gen_alpha_shape(cgalfile,alpha):
+def gen_alpha_shapes(alphas,shaper=GEOM.alpha_shapes):
     """
-        External system execution of alpha_shaper to generate a WKT alpha shape file.
-        Expects a CGAL file with lon lat corrdinates and the first line an integer
-        of the total number of lines to read
+        Generate the alpha shapes of the places for the report.
+        All the alphas share one triangulation
+        \param shaper GEOM.alpha_shapes (in process) or GEOM.alpha_shapes_cgal
     """
-    opt_alpha,wkt_polygons = GEOM.alpha_shape(cgalfile,alpha);
-    REPORT.set_alphas(alpha,opt_alpha)
-    REPORT.set_wkt_ashape(wkt_polygons)
+    lon, lat = place_coordinates()
+    lon, lat, weights = GEOM.snap_points(lon,lat,arguments.snap)
+    REPORT.set_snap(arguments.snap,weights)
+
+    opt_alpha,shapes = shaper(lon,lat,alphas)
+    shapes = [GEOM.simplify_shape(polygons,arguments.simplify) for polygons in shapes]
+    REPORT.set_optimal_alpha(opt_alpha)
+    if arguments.wkbFile:
+        with open(arguments.wkbFile, "wb") as fileh:
+            GEOM.write_shapes_wkb(fileh,opt_alpha,shapes)
+    for alpha, polygons in zip(alphas, shapes):
+        REPORT.add_wkt_ashape(alpha,GEOM.polygons_wkt(polygons))
 
 def finish_program():
     OF.close()
     S.stop()
     sys.exit(0)
 
-def write_file_cgal(fileh):
-    """
-        Writes a file to be read by cgal alpha_shape generator
-    """
-    fileh.write(str(len(PLACES))+"\n")
-    for p in PLACES:
-        fileh.write(p.lon+" "+p.lat+"\n")
-
 def write_file_csv(fileh):
     """
         Writes a CSV file to be opened by a GIS software. WKT
@@ -200,11 +252,9 @@ def write_file_csv(fileh):
 
 def write_file(fileh,wf):
     """
-        Write a file (fileh) with the format (wf). Accepting csv and cgal
+        Write a file (fileh) with the format (wf). Accepting csv
     """
-    if wf.lower() == 'cgal':
-        write_file_cgal(fileh)
-    elif wf.lower() == 'csv':
+    if wf.lower() == 'csv':
         write_file_csv(fileh)
     fileh.close()
 
@@ -225,39 +275,13 @@ signal.signal(signal.SIGINT, kill_handler)
 #  START
 #
 # ###########################
-for country in european_countries():
-    country_uri = country["place"]["value"]
-    country_name = country_uri.rpartition('/')[-1]
-    total_results = 0
-    offset = 0
-    query_results = 1
-
-    S.set_msg(country_name)
-
-    while query_results > 0:
-        try:
-            country_results = get_points(country_uri,query_list,offset,RESULTS_QUERY)
-
-            for result in country_results:
-                title = result["title"]["value"].encode('ascii','ignore')
-                lat = result ["geolat"]["value"]
-                lon = result["geolong"]["value"]
-                country = country_name
-                #abstract = result["abstract"]["value"].encode('ascii','ignore')
-                abstract = ""
-                if(lat!='NAN' and lon != 'NAN'):
-                    PLACES.append(cPlace.cPlace(title,lat,lon,abstract,country))
-
-            query_results = len(country_results)
-            offset = offset + query_results
-            total_results += query_results
-        except Exception as inst:
-            print type(inst)
-            print "EXCEPTION"
+fetched = SOURCE.fetch(selected_countries(), query_list)
 
+for country_uri, places in fetched:
+    PLACES.extend(places)
 
     if isdebug:
-        sys.stdout.write("\r\x1b[K"+country_uri+" "+str(total_results)+"\n")
+        sys.stdout.write("\r\x1b[K"+country_uri+" "+str(len(places))+"\n")
         sys.stdout.flush()
 
 REPORT.set_country_count(PLACES);
@@ -268,11 +292,15 @@ if (len(PLACES) > 0):
     #  POLYGON GENERATION
     #
     # ###########################
-    tmpfile = tempfile.NamedTemporaryFile(prefix='vagueplace',delete=False);
-    write_file(tmpfile,'cgal')
-
-    gen_alpha_shape(tmpfile,alpha);
-    gen_convex_hull();
+    if arguments.engine == 'cgal':
+        try:
+            gen_alpha_shapes(alphas,functools.partial(GEOM.alpha_shapes_cgal,kernel=arguments.kernel));
+        except (OSError, RuntimeError) as inst:
+            for alpha in alphas:
+                REPORT.add_wkt_ashape(alpha,str(inst))
+    else:
+        gen_alpha_shapes(alphas);
+    gen_convex_hull(arguments.country_hulls);
 
     # ###########################
     #